@@ -4,10 +4,10 @@
 //
 // Revision history:
 //  1.0 (2/20/2019) Initial version
+//  1.1 (10/18/2026) Report lock status over MQTT instead of HTTP
 #define BOX_DEBUG
 
 #include <ESP8266WiFi.h>
-#include <ESP8266HTTPClient.h>
 #include <ArduinoOTA.h>
 #include <EEPROM.h>
 #include "MQTT.h"
@@ -36,15 +36,15 @@ const char brokerIpAddr[] = "192.168.1.10";
 MQTT mqtt("ZombieBox", brokerIpAddr, mqttPort);
 bool connectedToBroker = false;
 
-// web server
-const char webserverIpAddr[] = "192.168.1.10";
-const int webserverPort = 80;
+// lock status for the web page -- the web server picks this up from the
+// broker, so we don't have to wait on it
+const char statusTopic[] = "zombie/status/lock/Box";
 
 // status of the maglock
 int maglockLocked = 0;
 
-// whether to send web update
-bool sendWebUpdate = false;
+// whether to send status update
+bool sendStatusUpdate = false;
 
 //*************************************************************************
 // Function prototypes
@@ -59,9 +59,8 @@ void unlockBox();
 void myCallback(uint32_t *client, const char* topic, uint32_t topicLen,
                    const char *data, uint32_t dataLen);
 
-// talk to web server
-void initWebStatus(int status);
-void updateWebStatus(int status);
+// tell the web server
+void publishStatus(int status);
 
 //********************************************************************************
 // Initialize the system. Set up all the servers and initialize the relay
@@ -89,7 +88,7 @@ void setup()
   connectMqtt();
 
   // send initial status to web server
-  initWebStatus(maglockLocked);
+  publishStatus(maglockLocked);
   
   // lock the box initially
   lockBox();
@@ -106,10 +105,10 @@ void loop(void) {
   ArduinoOTA.handle();
 
   // update the web page?
-  if (sendWebUpdate) {
-    sendWebUpdate = false;
+  if (sendStatusUpdate) {
+    sendStatusUpdate = false;
 
-    updateWebStatus(maglockLocked);  
+    publishStatus(maglockLocked);  
   }
   
   // wait a little bit
@@ -389,7 +388,7 @@ void unlockBox()
 
   // update status on web server
   maglockLocked = 0;
-  sendWebUpdate = true;
+  sendStatusUpdate = true;
 }
 
 //************************************************************************
@@ -404,42 +403,19 @@ void lockBox()
 
   // update status on web server
   maglockLocked = 1;
-  sendWebUpdate = true;
+  sendStatusUpdate = true;
 }
 
 //*****************************************
-// Initialize status on web page
+// Publish status for the web page (QoS 1 and
+// retained, so the web server always has
+// the latest even if it restarts)
 //*****************************************
-void initWebStatus(int status)
+void publishStatus(int status)
 {
-  WiFiClient client;
-  HTTPClient http;
-  String postData = "lockname=Box&status=" + String(status);
-  Serial.println("Init: " + postData);
+  String topic = statusTopic;
+  String payload = String(status);
+  Serial.println("Status: " + payload);
 
-  http.begin(client, "http://192.168.1.10/initlock");
-  http.addHeader("Content-Type", "application/x-www-form-urlencoded");
-
-  int result = http.POST(postData);
-  http.writeToStream(&Serial);
-  http.end();
+  mqtt.publish(topic, payload, 1, 1);
 }
-
-//*****************************************
-// Update status on web page
-//*****************************************
-void updateWebStatus(int status)
-{
-  WiFiClient client;
-  HTTPClient http;
-  String postData = "lockname=Box&status=" + String(status);
-  Serial.println("Update: " + postData);
-
-  http.begin(client, "http://192.168.1.10/updatelock");
-  http.addHeader("Content-Type", "application/x-www-form-urlencoded");
-
-  int result = http.POST(postData);
-  http.writeToStream(&Serial);
-  http.end();
-}
-
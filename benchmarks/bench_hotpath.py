@@ -0,0 +1,336 @@
+"""Latency benchmarks for the tag-to-magnet hot path and the web app
+
+    python benchmarks/bench_hotpath.py [--games N] [--update-baseline]
+
+Runs on the simulated hardware (sim_hardware), the real zombieweb app on
+a temporary database, and a stand-in MQTT client, and reports p50/p95/p99
+for each stage between a reader's GPIO edge and the dashboard showing the
+part as found:
+
+    callback    edge until bodyPart_callback returns
+    magnet_on   edge until the first magnet write
+    magnet_hold edge until the magnets are at holding power
+    sound       edge until the sound starts
+    dashboard   edge until the status change reaches the live feed
+    command     MQTT "unlock" until the state machine sees it
+
+It also measures throughput of /update and / with concurrent clients.
+The results are compared against baseline.json, and the run fails if
+any latency p95 got slower, or any throughput got lower, by more than
+the tolerance. The numbers depend on the machine, so make the baseline
+(--update-baseline) on the same box the comparison runs on.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# this has to happen before the prop modules pick their hardware
+os.environ['ZOMBIE_HARDWARE'] = 'sim'
+os.environ.setdefault('ZOMBIE_PATH', ROOT + '/')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'zombieweb'))
+
+import requests
+
+import config
+import sim_hardware
+import web_status
+import zombie
+from zombieweb import create_app
+from zombieweb.db import init_db
+from zombieweb.feed import feed
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values))) - 1))
+    return values[index]
+
+class WebResponse(object):
+    """Just enough of a requests.Response for the prop code"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.text = response.get_data(as_text=True)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+class WebStandIn(object):
+    """Stands in for the prop's requests.Session, sending everything
+    to the zombieweb app in this process instead of over HTTP
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _path(self, url):
+        return '/' + url.split('://', 1)[-1].split('/', 1)[-1]
+
+    def get(self, url, **kwargs):
+        return WebResponse(self.app.test_client().get(self._path(url)))
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return WebResponse(self.app.test_client().post(self._path(url),
+                                                       data=data, json=json))
+
+class MQTTStandIn(object):
+    """Stands in for the prop's paho client, remembering what was published"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload=None, **kwargs):
+        self.published.append((time.monotonic(), topic, payload))
+
+class Message(object):
+    """An incoming MQTT message"""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+class FeedWatcher(object):
+    """Watches the live feed for body parts changing to found, like the
+    dashboard does, and remembers when each one showed up
+    """
+
+    def __init__(self):
+        self.found = {}
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        with self._cond:
+            self.found.clear()
+
+    def waitFor(self, names, timeout=5.0):
+        with self._cond:
+            return self._cond.wait_for(lambda: set(names) <= set(self.found), timeout)
+
+    def _run(self):
+        since = feed.version
+        while not self._stop:
+            changes = feed.wait(since, timeout=0.5) or []
+            now = time.monotonic()
+            with self._cond:
+                for version, change in changes:
+                    since = version
+                    if change.get('type') == 'bodypart' and str(change['status']) == '1':
+                        self.found.setdefault(change['name'], now)
+                self._cond.notify_all()
+
+def setupProp(app):
+    """Point the prop at the simulated hardware and stand-ins"""
+    config.session = WebStandIn(app)
+    config.statusPublisher = web_status.StatusPublisher(config.session)
+    config.statusPublisher.start()
+    config.magnetTimer = config.scheduler.timer(zombie.magnetTimer_callback, 7200.0,
+                                                name='Magnets off', gameTime=True)
+    config.scheduler.listener = zombie.timerChanged
+    config.scheduler.start()
+    zombie.client = MQTTStandIn()
+
+    sim_hardware.GPIO.setmode(sim_hardware.GPIO.BCM)
+    zombie.sound_engine.init()
+    zombie.configZombie()
+    for pin in zombie.bodyParts:
+        sim_hardware.GPIO.addReader(pin)
+
+def benchHotPath(games, results):
+    """Find every part in each game, timing each stage"""
+    gpio = sim_hardware.GPIO
+    watcher = FeedWatcher()
+
+    for game in range(games):
+        # reset, like ZombieState.RESET does
+        zombie.clearEvents()
+        zombie.configZombie()
+        zombie.wakeup()
+        config.statusPublisher.flush(5.0)
+        watcher.reset()
+
+        edges = {}
+        for part in list(zombie.bodyParts.values()):
+            i2cStart = len(sim_hardware.i2cLog)
+            playStart = len(sim_hardware.mixer.plays)
+
+            start = time.monotonic()
+            gpio.setInput(part.pin, gpio.HIGH)
+            end = time.monotonic()
+            edges[part.name] = start
+
+            # let the magnet ramp finish
+            config.magnetScheduler.flush()
+
+            writes = [t for t, addr, reg, value in sim_hardware.i2cLog[i2cStart:]]
+            plays = [t for t, filename, channel in sim_hardware.mixer.plays[playStart:]]
+
+            results['callback'].append(end - start)
+            results['magnet_on'].append(writes[0] - start)
+            results['magnet_hold'].append(writes[-1] - start)
+            results['sound'].append(plays[0] - start)
+
+        if not watcher.waitFor(edges):
+            raise RuntimeError('Dashboard never showed all the parts as found')
+        for name, start in edges.items():
+            results['dashboard'].append(watcher.found[name] - start)
+
+        # MQTT command to the state machine
+        zombie.clearEvents()
+        start = time.monotonic()
+        zombie.on_message(zombie.client, None, Message(b'unlock'))
+        zombie.nextEvent(timeout=1.0)
+        results['command'].append(time.monotonic() - start)
+
+        # back to "no tag" for the next game
+        for part in zombie.bodyParts.values():
+            gpio.setInput(part.pin, gpio.LOW)
+            part.drop()
+
+def benchWeb(app, clients, count, results):
+    """Hammer /update and / from several threads at once"""
+    names = [part.name for part in zombie.bodyParts.values()]
+
+    def worker(route, latencies):
+        client = app.test_client()
+        for i in range(count):
+            start = time.monotonic()
+            if route == '/update':
+                response = client.post('/update', data={'name': names[i % len(names)],
+                                                        'status': i % 2})
+            else:
+                response = client.get('/')
+            latencies.append(time.monotonic() - start)
+            if response.status_code != 200:
+                errors.append(route + ' returned ' + response.status)
+
+    errors = []
+    for route in ('/update', '/'):
+        latencies = []
+        threads = [threading.Thread(target=worker, args=(route, latencies))
+                   for i in range(clients)]
+
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        if errors:
+            raise RuntimeError(errors[0])
+
+        results[route] = latencies
+        results[route + ' rps'] = len(latencies) / elapsed
+
+def summarize(results):
+    """Flatten the results into the metrics kept in the baseline"""
+    metrics = {}
+    for name, values in results.items():
+        if isinstance(values, list):
+            for p in (50, 95, 99):
+                metrics['%s p%d ms' % (name, p)] = percentile(values, p) * 1000
+        else:
+            metrics[name] = values
+
+    return metrics
+
+def compare(metrics, baseline, tolerance, minDelta):
+    """List the metrics that regressed against the baseline. A latency
+    only counts as a regression if it's also more than minDelta ms worse,
+    so noise on sub-millisecond numbers doesn't fail the run.
+    """
+    regressions = []
+    for name, old in sorted(baseline.items()):
+        new = metrics.get(name)
+        if new is None:
+            continue
+
+        if name.endswith(' rps'):
+            worse = new < old * (1 - tolerance)
+        elif name.endswith(' p95 ms'):
+            worse = new > old * (1 + tolerance) and new - old > minDelta
+        else:
+            # p50 and p99 are just for information
+            worse = False
+
+        if worse:
+            regressions.append('%s: %.3f (baseline %.3f)' % (name, new, old))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=50)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=250,
+                        help='requests per client for the web benchmark')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed regression, as a fraction of the baseline')
+    parser.add_argument('--min-delta', type=float, default=2.0,
+                        help='smallest latency regression that counts, in ms')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='save these results as the new baseline')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'zombieweb.sqlite')
+    app = create_app({'TESTING': True, 'DATABASE': database})
+    with app.app_context():
+        init_db()
+
+    results = {name: [] for name in ('callback', 'magnet_on', 'magnet_hold',
+                                      'sound', 'dashboard', 'command')}
+
+    # the prop prints a lot, which would swamp the timing
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        setupProp(app)
+        benchHotPath(args.games, results)
+        benchWeb(app, args.clients, args.requests, results)
+    finally:
+        sys.stdout = stdout
+        config.magnetTimer.cancel()
+        config.statusPublisher.close()
+
+    metrics = summarize(results)
+    for name, value in sorted(metrics.items()):
+        print('%-28s %10.3f' % (name, value))
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(metrics, f, indent=4, sort_keys=True)
+        print('Saved baseline to', args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline to compare against')
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(metrics, json.load(f), args.tolerance,
+                              args.min_delta)
+
+    if regressions:
+        print('Regressions:')
+        for regression in regressions:
+            print('   ', regression)
+        return 1
+
+    print('No regressions')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,12 @@
 """A body part for the escape room Zombie prop
 """
 
-import array
-import time
 import atexit
-import time
-import csv
-from Adafruit_MotorHAT import Adafruit_MotorHAT, Adafruit_DCMotor
 from enum import Enum
-import RPi.GPIO as GPIO
-from pygame import mixer
+import game_log
+import magnet_control
+import sound_engine
 import config
-import requests
 
 class BodyPartState(Enum):
     """State of the body part / magnet"""
@@ -26,69 +21,88 @@ class BodyPart(object):
         name (str): name of body part
         state (int): state of body part -- in place or not
         tag (array of ints): NFC tag attached to this body part
-        magnets (list of Adafruit_DCMotor): magnets/motors
+        magnets (list of motor_bus.BatchedMotor): magnets/motors
         pin (int): GPIO pin used by this body part
         soundfile (str): name of file to play when part is found
+        rampProfile (list of (int, float)): magnet (speed, seconds) steps
+        dropDelay (float): seconds after the drop starts to drop this part
+            (None to use the default spacing)
+        sound (mixer.Sound): decoded sound, shared across resets
+        channel (mixer.Channel): mixer channel reserved for this part
+        reader (reader_link.ReaderLink): serial link to the part's reader
+            (None if it only has the GPIO pin)
     """
 
-    def __init__(self, name, pin, magnets, tag, soundfile):
+    def __init__(self, name, pin, magnets, tag, soundfile, rampProfile=None,
+                 dropDelay=None, reader=None):
         """Initialize the body part"""
 
         self.name = name
         self.state = BodyPartState.IDLE
         self.tag = tag
         self.magnets = magnets
+        self.rampProfile = rampProfile or magnet_control.DEFAULT_PROFILE
+        self.dropDelay = dropDelay
         self.pin = pin
-        self.sound = mixer.Sound(soundfile)
-        self.sound.set_volume(1.0)
+        self.sound = sound_engine.load(soundfile)
+        self.channel = sound_engine.channel(name)
+        self.reader = reader
 
         # turn off motor and reader at close
         atexit.register(self.close)
 
         # update  the web server
-        payload = {'name' :  self.name, 'status' : 0}
-        config.session.post('http://localhost/insert', data=payload)
+        config.statusPublisher.insert(self.name, 0)
         
+    def reset(self):
+        """Get ready for a new game -- drop the part and clear the status"""
+        self.drop()
+        self.state = BodyPartState.IDLE
+
+        # update  the web server
+        config.statusPublisher.insert(self.name, 0)
+
+    def remove(self):
+        """Turn off the magnets, we're not being used any more"""
+        self.drop()
+        if self.reader is not None:
+            self.reader.close()
+        atexit.unregister(self.close)
+
     def isFound(self):
         """Getter for the current state"""
         
         return self.state == BodyPartState.TAG_FOUND
     
     def close(self):
-        """Turn off the magnets """
-        for m in self.magnets:
-            m.run(Adafruit_MotorHAT.RELEASE)
+        """Turn off the magnets and the reader link"""
+        self.drop()
+        if self.reader is not None:
+            self.reader.close()
             
         # update web page
-        payload = {'name' :  self.name, 'status' : 0}
-        config.session.post('http://localhost/update', data=payload)
+        config.statusPublisher.update(self.name, 0)
         
             
-    def foundMyTag(self):
-        """Turn on the magnets and play a sound
+    def foundMyTag(self, since=None):
+        """Turn on the magnets and play a sound. since is when the
+        part was found (from time.perf_counter()), for the metrics.
         """
-        # turn on the magnets full blast
-        for m in self.magnets:
-            m.setSpeed(250)
-            m.run(Adafruit_MotorHAT.FORWARD)
-                    
-        # wait a bit
-        time.sleep(0.1)
-        
-        # turn down the magnets
-        for m in self.magnets:
-            m.setSpeed(180)
+        # ramp up the magnets in the background
+        config.magnetScheduler.ramp(self.magnets, self.rampProfile, since)
                     
         # play a sound
         print(self.name, ' found')
-        self.sound.play()
+        self.channel.play(self.sound)
         
-        # update  the web server
-        payload = {'name' :  self.name, 'status' : 1}
-        config.session.post('http://localhost/update', data=payload)
+        # log it (just a copy into memory, so it doesn't slow us down)
+        config.gameLog.log(game_log.PART_FOUND, self.pin, self.name)
+        
+        # update  the web server (queued, so we don't wait on HTTP here)
+        config.statusPublisher.update(self.name, 1)
         
         # start the timer if it's not already running
-        if not config.magnetTimer.is_alive():
+        if not config.magnetTimer.active():
             print("Starting timer")
             config.magnetTimer.start()
 
@@ -106,17 +120,16 @@ class BodyPart(object):
             print(self.name, ' tag removed')
         
         # update  the web server
-        payload = {'name' :  self.name, 'status' : 0}
-        config.session.post('http://localhost/update', data=payload)
+        config.statusPublisher.update(self.name, 0)
         
         # update state
         self.state = BodyPartState.IDLE
         
     
-    def drop(self):
-        # drop the body part
-        for m in self.magnets:
-            m.run(Adafruit_MotorHAT.RELEASE)
+    def drop(self, delay=0.0):
+        # drop the body part (after the delay, in seconds), cancelling
+        # any ramp in progress
+        config.magnetScheduler.release(self.magnets, delay)
             
 
 
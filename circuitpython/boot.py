@@ -0,0 +1,8 @@
+"""
+Turns on the second USB serial port, which code.py uses to talk to the Pi
+(the first one stays the console).
+"""
+
+import usb_cdc
+
+usb_cdc.enable(console=True, data=True)
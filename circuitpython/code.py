@@ -1,11 +1,19 @@
 """
-Searches for a specific NFC tag, corresponding to a different body part.
+Reads NFC tags for one of the body parts. If the reader has a serial link,
+the Pi tells it which tag belongs to its body part (see reader_link.py on the
+Pi), and the reader remembers it, so it keeps working even if the link isn't
+connected. Readers that never hear from the Pi look for board_tag, so set
+that to the tag of the body part each board goes with when flashing it.
+
+The reader drives its pin to the Pi high while the right tag is there, and
+sends every UID it sees to the Pi as it sees it.
 This code was adapted from the adafruit circuit playground examples.
 """
 
 import board
 import busio
 import digitalio
+import microcontroller
 import supervisor
 
 #
@@ -13,33 +21,119 @@ import supervisor
 #
 from adafruit_pn532.i2c import PN532_I2C
 
+# serial frames -- SYNC, type, payload length, payload, then the xor of
+# the type, length and payload bytes (same as reader_link.py on the Pi)
+SYNC = 0xA5
+UID = 0x01          # to the Pi: a tag showed up, payload is its UID
+NO_TAG = 0x02       # to the Pi: the tag went away
+HELLO = 0x03        # to the Pi: we just started, payload is the tag we look for
+SET_TAG = 0x10      # from the Pi: the tag to look for, payload is its UID
+
+# how long each read waits for a tag, in seconds. With no tag around we wait
+# longer (a tag that shows up during the wait is seen right away), but once
+# there's a tag we poll quickly so we notice when it's gone.
+IDLE_TIMEOUT = 0.25
+PRESENT_TIMEOUT = 0.05
+
+# missed reads in a row before we decide the tag is really gone
+MISSES = 3
+
+# NFC tag this board looks for, until the Pi tells it otherwise
+board_tag = bytes([167, 75, 126, 242])      # head
+# board_tag = bytes([151, 207, 126, 242])   # right leg
+# board_tag = bytes([7, 76, 126, 242])      # left leg
+# board_tag = bytes([55, 167, 128, 242])    # right arm
+# board_tag = bytes([71, 208, 126, 242])    # left arm
+# board_tag = bytes([231, 206, 126, 242])   # chest
+
+# spare tag for testing, always accepted
+extra_tag = bytes([247, 71, 128, 242])
+
+def frame(kind, payload=b''):
+    """Build a serial frame"""
+    check = kind ^ len(payload)
+    for b in payload:
+        check ^= b
+    return bytes([SYNC, kind, len(payload)]) + bytes(payload) + bytes([check])
+
+class Decoder(object):
+    """Pulls frames out of the bytes coming in from the Pi"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add some bytes, returning a list of (type, payload) frames"""
+        self.buffer.extend(data)
+        frames = []
+        while True:
+            # skip anything before the next sync byte
+            start = self.buffer.find(bytes([SYNC]))
+            if start < 0:
+                self.buffer = bytearray()
+                return frames
+            self.buffer = self.buffer[start:]
+
+            if len(self.buffer) < 4 or len(self.buffer) < self.buffer[2] + 4:
+                return frames
+
+            length = self.buffer[2]
+            kind = self.buffer[1]
+            payload = bytes(self.buffer[3:3 + length])
+            check = kind ^ length
+            for b in payload:
+                check ^= b
+
+            if check == self.buffer[3 + length]:
+                frames.append((kind, payload))
+                self.buffer = self.buffer[4 + length:]
+            else:
+                # bad frame, so look for the next sync byte
+                self.buffer = self.buffer[1:]
+
+def open_link():
+    """Serial link to the Pi -- the USB data port if boot.py turned it on,
+    otherwise None (the UART's TX is D4 on the Trinket, which is our pin to
+    the Pi, so that's not an option)
+    """
+    try:
+        import usb_cdc
+    except ImportError:
+        return None
+
+    if usb_cdc.data is not None:
+        usb_cdc.data.timeout = 0
+    return usb_cdc.data
+
+def load_tag():
+    """The tag the Pi told us about last time (saved in nvm), or None"""
+    length = microcontroller.nvm[0]
+    if length == 0 or length > 10:
+        return None
+    return bytes(microcontroller.nvm[1:1 + length])
+
+def save_tag(tag):
+    """Remember the tag, if it changed (nvm wears out)"""
+    if tag != load_tag():
+        microcontroller.nvm[1:1 + len(tag)] = tag
+        microcontroller.nvm[0] = len(tag)
+
 try:
     # onboard LED
     led = digitalio.DigitalInOut(board.D13)
     led.direction = digitalio.Direction.OUTPUT
 
-    # connection  to RPi
-    pin = digitalio.DigitalInOut(board.D4)
-    pin.direction = digitalio.Direction.OUTPUT
-    pin.value = False        # no tag yet
-    
-    # NFC tag we're looking for
-    tag = bytes([167, 75, 126, 242])      # head
-    # tag = bytes([151, 207, 126, 242])       # right leg
-    # tag = bytes([7, 76, 126, 242])        # left leg
-    # tag = bytes([55, 167, 128, 242])      # right arm
-    # tag = bytes([71, 208, 126, 242])      # left arm
-    # tag = bytes([231, 206, 126, 242])     # chest
-    extra_tag = bytes([247, 71, 128, 242])  # spare tag for testing
+    # NFC tag we're looking for -- whatever the Pi told us last, or ours
+    tag = load_tag() or board_tag
 
     # I2C connection:
     i2c = busio.I2C(board.SCL, board.SDA)
 
     while not i2c.try_lock():
         pass
-    
+
     i2c.unlock()
-    
+
     # Non-hardware
     pn532 = PN532_I2C(i2c, debug=False)
 
@@ -49,20 +143,61 @@ try:
     # Configure PN532 to communicate with MiFare cards
     pn532.SAM_configuration()
 
+    # serial link to the Pi, so it can send us our tag
+    link = open_link()
+    decoder = Decoder()
+    if link is not None:
+        link.write(frame(HELLO, tag))
+
+    # connection  to RPi -- we only start driving it once we're ready, so
+    # the Pi can tell we're up (a floating pin means we're still booting)
+    pin = digitalio.DigitalInOut(board.D4)
+    pin.direction = digitalio.Direction.OUTPUT
+    pin.value = False        # no tag yet
+
+    # the tag that's there now, and how many reads in a row have missed it
+    current = None
+    misses = 0
+
     print('Waiting for RFID/NFC card...')
     while True:
+        # anything from the Pi?
+        waiting = link.in_waiting if link is not None else 0
+        if waiting:
+            for kind, payload in decoder.feed(link.read(waiting)):
+                if kind == SET_TAG and payload:
+                    tag = payload
+                    save_tag(tag)
+                    print('Looking for tag', [hex(i) for i in tag])
+
         # Check if a card is available to read
-        uid = pn532.read_passive_target(timeout=0.5)
-
-        # Is it the one  we want?
-        if uid == tag or uid == extra_tag:
-            led.value = True
-            pin.value = True
-            print('Found card with UID:', [hex(i) for i in uid])
-        
+        uid = pn532.read_passive_target(
+            timeout=IDLE_TIMEOUT if current is None else PRESENT_TIMEOUT)
+
+        message = None
+        if uid is None:
+            if current is not None:
+                misses += 1
+                if misses >= MISSES:
+                    current = None
+                    message = frame(NO_TAG)
         else:
-            led.value = False
-            pin.value = False
-            
+            misses = 0
+            uid = bytes(uid)
+            if uid != current:
+                current = uid
+                message = frame(UID, uid)
+
+        # Is it the one  we want? (the pin goes first, it's the fast path)
+        found = current is not None and (current == tag or current == extra_tag)
+        led.value = found
+        pin.value = found
+
+        if message is not None:
+            if link is not None:
+                link.write(message)
+            if current is not None:
+                print('Found card with UID:', [hex(i) for i in current])
+
 except Exception:
-    supervisor.reload()
\ No newline at end of file
+    supervisor.reload()
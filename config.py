@@ -2,7 +2,12 @@
 """
 
 from threading import Timer
+import os
 import requests
+import game_log
+import web_status
+import magnet_control
+import scheduler as timers
 
 def dummy():
     """Dummy function just so we can create global timer
@@ -12,5 +17,21 @@ def dummy():
 # global timer used to turn off magnets
 magnetTimer = None
 
-# session for  talking to web server
-session = requests.Session()
\ No newline at end of file
+# session for  talking to web server (with the web server's DEVICE_TOKEN,
+# if it has one)
+session = requests.Session()
+if os.environ.get('ZOMBIE_DEVICE_TOKEN'):
+    session.headers['X-Device-Token'] = os.environ['ZOMBIE_DEVICE_TOKEN']
+
+# background publisher for status updates to the web server
+statusPublisher = web_status.StatusPublisher(session)
+
+# log of game events, for the web server's analytics page
+gameLog = game_log.GameLog(os.environ.get('ZOMBIE_GAME_LOG',
+                                          '/var/lib/zombie/games.log'))
+
+# runs all the prop's timers on one background thread
+scheduler = timers.Scheduler()
+
+# runs the magnet ramps in the background
+magnetScheduler = magnet_control.MagnetScheduler(scheduler)
@@ -0,0 +1,137 @@
+"""Append-only log of game events for the zombie prop
+
+Each event is a fixed 32 byte record (see RECORD) written into a
+memory-mapped file, so logging is just a copy into memory -- no system
+calls on the GPIO callback path. The file is preallocated and zero-filled,
+so after a restart we find the end by looking for the first empty record.
+
+When the file gets close to full, it's rotated at the start of the next
+game (games.log -> games.log.1 -> games.log.2 ...), so a game never
+straddles two files. The web server reads these files for its analytics
+page (zombieweb/zombieweb/gamelog.py).
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+# time (from time.time()), event, GPIO pin (0 if none), body part name
+RECORD = struct.Struct('<dBB16s6x')
+
+# events
+GAME_START = 1      # the prop reset and locked
+PART_FOUND = 2      # a body part was found
+ALL_FOUND = 3       # every body part is in place
+UNLOCK = 4          # the prop unlocked
+RESET = 5           # reset command
+UNLOCK_COMMAND = 6  # unlock command
+MAGNET_TIMEOUT = 7  # the magnets were on too long
+PAUSE = 8           # game time paused
+RESUME = 9          # game time resumed
+
+class GameLog(object):
+    """Memory-mapped, size-rotated game event log
+
+    Attributes:
+        filename (str): log file, rotated files get .1, .2 ... added
+        maxSize (int): size of each file, in bytes
+        keep (int): how many rotated files to keep
+        gameRoom (int): records to leave room for when starting a game
+    """
+
+    def __init__(self, filename, maxSize=1 << 20, keep=8, gameRoom=256):
+        """Initialize the log (call open() to start logging)"""
+
+        self.filename = filename
+        self.maxSize = maxSize - maxSize % RECORD.size
+        self.keep = keep
+        self.gameRoom = gameRoom
+
+        self._map = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Open (or create) the log file and find where we left off"""
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            self._open()
+
+    def close(self):
+        """Close the log file"""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def startGame(self):
+        """Log the start of a game, rotating first if the file is nearly full"""
+        with self._lock:
+            if (self._map is not None and
+                    self._offset + self.gameRoom * RECORD.size > self.maxSize):
+                # the game runs fine without the log, so a full disk or
+                # a permissions problem just stops the logging
+                try:
+                    self._rotate()
+                except OSError as e:
+                    print('Game log rotation failed, not logging:', e)
+                    if self._map is not None:
+                        self._map.close()
+                        self._map = None
+
+        self.log(GAME_START)
+
+    def log(self, event, pin=0, name=''):
+        """Log an event -- does nothing if the log isn't open, or is full"""
+        with self._lock:
+            if self._map is None or self._offset + RECORD.size > self.maxSize:
+                return
+
+            RECORD.pack_into(self._map, self._offset, time.time(), event, pin,
+                             name.encode('utf-8')[:16])
+            self._offset += RECORD.size
+
+    def _open(self):
+        """Map the current file, creating it if needed"""
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != self.maxSize:
+                os.ftruncate(fd, self.maxSize)
+            self._map = mmap.mmap(fd, self.maxSize)
+        finally:
+            os.close(fd)
+
+        self._offset = self._end()
+
+    def _end(self):
+        """Offset of the first empty record, by binary search (records are
+        only ever appended, so the empty ones are all at the end)
+        """
+        lo = 0
+        hi = self.maxSize // RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(self._map, mid * RECORD.size)[0] == 0.0:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        return lo * RECORD.size
+
+    def _rotate(self):
+        """Move the current file to .1 (and so on) and start a new one"""
+        self._map.close()
+        self._map = None
+
+        for i in range(self.keep - 1, 0, -1):
+            old = '%s.%d' % (self.filename, i)
+            if os.path.exists(old):
+                os.replace(old, '%s.%d' % (self.filename, i + 1))
+        os.replace(self.filename, self.filename + '.1')
+
+        self._open()
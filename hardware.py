@@ -0,0 +1,25 @@
+"""Hardware used by the zombie prop. Everything that touches the Pi's
+GPIO pins, the motor controllers or the sound card imports it from here.
+
+By default this is the real hardware. Set the environment variable
+ZOMBIE_HARDWARE=sim to use the pure software stand-ins in sim_hardware
+instead, so the prop can run (and be profiled) without a Pi.
+
+clock is where the timers and waits get the time -- the time module on
+the Pi, or the simulated clock, which can run on virtual time.
+"""
+
+import os
+
+# which backend we're using -- 'pi' or 'sim'
+backend = os.environ.get('ZOMBIE_HARDWARE', 'pi')
+
+if backend == 'sim':
+    from sim_hardware import GPIO, Adafruit_MotorHAT, Adafruit_DCMotor, mixer, clock
+elif backend == 'pi':
+    import time as clock
+    import RPi.GPIO as GPIO
+    from Adafruit_MotorHAT import Adafruit_MotorHAT, Adafruit_DCMotor
+    from pygame import mixer
+else:
+    raise ImportError('Unknown ZOMBIE_HARDWARE backend: ' + backend)
@@ -0,0 +1,149 @@
+"""Magnet control for the zombie prop -- runs the power ramp for each
+magnet in the background, so the GPIO callback never has to sleep
+"""
+
+import threading
+import time
+from hardware import Adafruit_MotorHAT
+import metrics
+
+# full blast for a moment to grab the part, then down to holding power
+DEFAULT_PROFILE = [(250, 0.1), (180, None)]
+
+# how long a found part waits for its magnets
+edgeToMagnet = metrics.histogram(
+    'zombie_edge_to_magnet_seconds',
+    'Time from a part being found to its magnets turning on')
+
+def parseProfile(text):
+    """Parse a ramp profile from the config file, like "250:0.1 180".
+    Each step is a speed, and how long to hold it in seconds; the last
+    step is held until the part is dropped. Returns a list of
+    (speed, seconds) steps, or the default profile if text is empty.
+    """
+    if not text:
+        return list(DEFAULT_PROFILE)
+
+    steps = list()
+    for step in text.split():
+        speed, _, duration = step.partition(':')
+        steps.append((int(speed), float(duration) if duration else None))
+
+    return steps
+
+def flush(magnets):
+    """Write the queued changes for the magnets, once per controller"""
+    for bus in set(m.bus for m in magnets):
+        bus.flush()
+
+class MagnetScheduler(object):
+    """Runs the ramp profiles for all the magnets as timers on the
+    prop's scheduler (see scheduler.py).
+
+    ramp() just queues the steps and returns, so it's safe to call from
+    the GPIO callback. Several parts can ramp at once without waiting on
+    each other. Dropping a magnet cancels whatever is left of its ramp,
+    and drops can be scheduled for later too.
+    """
+
+    def __init__(self, scheduler):
+        """Initialize the magnets' timers on the scheduler"""
+
+        self.scheduler = scheduler
+
+        # bumped whenever a magnet is dropped, to cancel its old steps
+        self._generation = {}
+
+        # steps that haven't run yet
+        self._pending = 0
+
+        self._cond = threading.Condition()
+        self._busLock = threading.Lock()
+
+    def ramp(self, magnets, profile, since=None):
+        """Turn on the magnets, stepping through the profile. since is
+        when the part was found (from time.perf_counter()), if we know.
+
+        The first step is written right here, so the magnets grab the
+        part without waiting on the scheduler thread; only the later
+        steps are queued.
+        """
+        with self._cond:
+            generations = [(m, self._cancel(m)) for m in magnets]
+
+        delay = 0.0
+        for i, (speed, duration) in enumerate(profile):
+            if i == 0:
+                self._write(generations, speed, True)
+                if since is not None:
+                    edgeToMagnet.observe(time.perf_counter() - since)
+            else:
+                self._schedule(delay, generations, speed)
+            delay += duration or 0.0
+
+    def release(self, magnets, delay=0.0):
+        """Turn off the magnets after the delay (in seconds), cancelling
+        any ramp in progress. With no delay they're off before we return.
+        """
+        with self._cond:
+            generations = [(m, self._cancel(m)) for m in magnets]
+
+        if delay > 0:
+            self._schedule(delay, generations, None)
+            return
+
+        with self._busLock:
+            for m in magnets:
+                m.run(Adafruit_MotorHAT.RELEASE)
+            flush(magnets)
+
+    def flush(self, timeout=None):
+        """Wait until every queued step has run.
+        Returns True if we're caught up, False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def _cancel(self, magnet):
+        """Cancel pending steps for a magnet, returning its new generation"""
+        generation = self._generation.get(magnet, 0) + 1
+        self._generation[magnet] = generation
+        return generation
+
+    def _schedule(self, delay, generations, speed):
+        """Queue one step for a group of magnets, where a speed of None
+        means release them. The magnets all change in one flush.
+        """
+        with self._cond:
+            self._pending += 1
+
+        self.scheduler.schedule(delay, lambda: self._step(generations, speed))
+
+    def _write(self, generations, speed, start=False):
+        """Set the magnets that are still on this ramp (or drop) to the
+        speed, starting them if start is True
+        """
+        with self._busLock:
+            # skip any magnet that's been dropped or ramped again since
+            due = [m for m, generation in generations
+                   if self._generation.get(m) == generation]
+
+            for m in due:
+                if speed is None:
+                    m.run(Adafruit_MotorHAT.RELEASE)
+                    continue
+
+                m.setSpeed(speed)
+                if start:
+                    m.run(Adafruit_MotorHAT.FORWARD)
+
+            flush(due)
+
+    def _step(self, generations, speed):
+        """Run a queued step (on the scheduler thread)"""
+        try:
+            self._write(generations, speed)
+        finally:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
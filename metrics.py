@@ -0,0 +1,237 @@
+"""Counters and latency histograms for the zombie prop and web server,
+written out in the Prometheus text format.
+
+This only uses the standard library. The web server has a trimmed copy
+(just the histograms) in zombieweb/zombieweb/metrics.py, so fix things
+in both. Recording is a dict lookup, a bisect and a lock, so it's cheap
+enough for the GPIO callback and every request.
+"""
+
+import bisect
+import http.server
+import threading
+
+# latency buckets, in seconds -- from half a millisecond up to ten seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def formatValue(value):
+    """A number the way Prometheus writes it"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def escape(value):
+    """Escape a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def formatLabels(names, values, extra=()):
+    """{name="value",...} for a sample, or nothing if it has no labels"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, escape(value))
+                          for name, value in pairs) + '}'
+
+class Metric(object):
+    """Base for counters and histograms. A metric with label names gets
+    one child per set of label values, from labels(); one without labels
+    is used directly, and shows up as zero from the start.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+        self._children = {}
+        self._lock = threading.Lock()
+
+        if not self.labelnames:
+            self._children[()] = self._newChild()
+
+    def labels(self, *values):
+        """The child for these label values, created the first time"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('%s takes labels %s' % (self.name, self.labelnames))
+
+            with self._lock:
+                child = self._children.setdefault(values, self._newChild())
+
+        return child
+
+    def _newChild(self):
+        raise NotImplementedError
+
+    def render(self):
+        """Lines of the text format for this metric"""
+        lines = ['# HELP %s %s' % (self.name, self.help.replace('\n', ' ')),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+
+        with self._lock:
+            children = sorted(self._children.items())
+
+        for values, child in children:
+            lines.extend(child.render(self.name, self.labelnames, values))
+
+        return lines
+
+class CounterValue(object):
+    """One counter (a counter metric's child)"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return ['%s_total%s %s' % (name, formatLabels(labelnames, values),
+                                   formatValue(self.value))]
+
+class Counter(Metric):
+    """Counts things, like requests or failed posts. The name shouldn't
+    end in _total -- that gets added.
+    """
+
+    kind = 'counter'
+
+    def _newChild(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class HistogramValue(object):
+    """One histogram (a histogram metric's child)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (
+                name, formatLabels(labelnames, values, [('le', formatValue(bound))]),
+                cumulative))
+
+        labels = formatLabels(labelnames, values)
+        lines.append('%s_sum%s %s' % (name, labels, formatValue(total)))
+        lines.append('%s_count%s %d' % (name, labels, cumulative))
+        return lines
+
+class Histogram(Metric):
+    """Counts values (usually seconds) into buckets, so we can get
+    percentiles, plus their count and sum
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _newChild(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+class Registry(object):
+    """All the metrics a process has, in the order they were made"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            # asking for the same metric twice gets the same one
+            old = self._metrics.get(metric.name)
+            if old is not None:
+                if type(old) is not type(metric) or old.labelnames != metric.labelnames:
+                    raise ValueError('%s is already a different metric' % metric.name)
+                return old
+
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """Everything, in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# the process's metrics
+registry = Registry()
+
+def counter(name, help, labelnames=()):
+    return registry.counter(name, help, labelnames)
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.histogram(name, help, labelnames, buckets)
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every GET with the registry's metrics"""
+
+    registry = registry
+
+    def do_GET(self):
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # no line on the console for every scrape
+        pass
+
+def serve(port, host='127.0.0.1'):
+    """Serve the metrics over HTTP from a background thread, for
+    Prometheus (or curl) to scrape. Only local by default.
+    Returns the server, so it can be shut down.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever, name='Metrics',
+                              daemon=True)
+    thread.start()
+    return server
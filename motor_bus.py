@@ -0,0 +1,129 @@
+"""I2C batching for the motor controllers that drive the magnets
+
+Each Adafruit_MotorHAT is a PCA9685 PWM chip, and every run() or
+setSpeed() on a motor normally turns into separate single register
+writes. MotorBus keeps track of what each PWM channel is set to, holds
+changes until flush(), skips anything that didn't actually change, and
+writes runs of neighbouring channels in one auto-incremented block.
+"""
+
+import threading
+from hardware import Adafruit_MotorHAT
+
+class MotorBus(object):
+    """Batches PWM updates for one motor controller
+
+    Attributes:
+        hat (Adafruit_MotorHAT): the motor controller
+        i2c: I2C device for the controller's PCA9685
+    """
+    MODE1 = 0x00
+    LED0_ON_L = 0x06
+    AUTO_INCREMENT = 0x20
+
+    # longest block we'll write, in channels (4 bytes each, 32 byte limit)
+    MAX_RUN = 8
+
+    def __init__(self, hat):
+        """Initialize the bus, turning on register auto-increment"""
+
+        self.hat = hat
+        self.i2c = hat._pwm.i2c
+
+        # (on, off) for each channel, as last written and waiting to be written
+        self._current = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        mode1 = self.i2c.readU8(self.MODE1)
+        self.i2c.write8(self.MODE1, mode1 | self.AUTO_INCREMENT)
+
+    def getMotor(self, num):
+        """Get a batched motor, numbered like Adafruit_MotorHAT.getMotor()"""
+        return BatchedMotor(self, self.hat.getMotor(num))
+
+    def setPWM(self, channel, on, off):
+        """Queue a PWM change for a channel"""
+        with self._lock:
+            if self._current.get(channel) == (on, off):
+                self._pending.pop(channel, None)
+            else:
+                self._pending[channel] = (on, off)
+
+    def setPin(self, pin, value):
+        """Queue a channel to be fully off (0) or fully on (1)"""
+        if value == 0:
+            self.setPWM(pin, 0, 4096)
+        if value == 1:
+            self.setPWM(pin, 4096, 0)
+
+    def flush(self):
+        """Write all the queued changes"""
+        with self._lock:
+            if not self._pending:
+                return
+
+            channels = sorted(self._pending)
+
+            # group neighbouring channels into blocks -- a small gap of
+            # unchanged channels gets filled in with their current values,
+            # since one bigger write beats two small ones
+            runs = [[channels[0]]]
+            for channel in channels[1:]:
+                run = runs[-1]
+                gap = range(run[-1] + 1, channel)
+                if (len(gap) <= 2 and len(run) + len(gap) < self.MAX_RUN
+                        and all(c in self._current for c in gap)):
+                    for c in gap:
+                        self._pending[c] = self._current[c]
+                    run.extend(gap)
+                    run.append(channel)
+                else:
+                    runs.append([channel])
+
+            for run in runs:
+                data = list()
+                for channel in run:
+                    on, off = self._pending[channel]
+                    data += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+
+                # if this fails, whatever's left stays pending for next time
+                self.i2c.writeList(self.LED0_ON_L + 4 * run[0], data)
+
+                for channel in run:
+                    self._current[channel] = self._pending.pop(channel)
+
+class BatchedMotor(object):
+    """A magnet on a MotorBus -- same interface as Adafruit_DCMotor, but
+    nothing is written until the bus is flushed
+
+    Attributes:
+        bus (MotorBus): the controller this magnet is on
+        PWMpin, IN1pin, IN2pin (int): PWM channels, same as Adafruit_DCMotor
+    """
+
+    def __init__(self, bus, motor):
+        """Initialize the motor, using the pins of the Adafruit motor"""
+        self.bus = bus
+        self.PWMpin = motor.PWMpin
+        self.IN1pin = motor.IN1pin
+        self.IN2pin = motor.IN2pin
+
+    def run(self, command):
+        if command == Adafruit_MotorHAT.FORWARD:
+            self.bus.setPin(self.IN2pin, 0)
+            self.bus.setPin(self.IN1pin, 1)
+        if command == Adafruit_MotorHAT.BACKWARD:
+            self.bus.setPin(self.IN1pin, 0)
+            self.bus.setPin(self.IN2pin, 1)
+        if command == Adafruit_MotorHAT.RELEASE:
+            self.bus.setPin(self.IN1pin, 0)
+            self.bus.setPin(self.IN2pin, 0)
+
+    def setSpeed(self, speed):
+        speed = max(0, min(255, speed))
+        self.bus.setPWM(self.PWMpin, 0, speed * 16)
+
+    def flush(self):
+        """Write any queued changes on this magnet's controller"""
+        self.bus.flush()
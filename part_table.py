@@ -0,0 +1,74 @@
+"""Found/not found table for the zombie's body parts
+"""
+
+import threading
+from hardware import clock
+
+class PartTable(object):
+    """Tracks which body parts are in place, as a bitmask
+
+    Each body part pin gets a bit in found. Changes are made under a lock,
+    but found is always replaced by a new int in one step, so readers
+    (like the main loop) just look at it without locking.
+
+    Attributes:
+        found (int): bitmask of the parts that are in place
+        allMask (int): bitmask with every part's bit set
+        debounce (float): edges closer together than this (in seconds)
+            on the same pin are treated as noise
+    """
+
+    def __init__(self, debounce=0.05):
+        """Initialize an empty table"""
+
+        self.found = 0
+        self.allMask = 0
+        self.debounce = debounce
+
+        self._bits = {}          # pin -> bit
+        self._lastChange = {}    # pin -> time of last real change
+        self._lock = threading.Lock()
+
+    def configure(self, pins):
+        """Start over with a new set of body part pins, none of them found"""
+        with self._lock:
+            self._bits = {pin : 1 << i for i, pin in enumerate(pins)}
+            self._lastChange = {}
+            self.allMask = (1 << len(self._bits)) - 1
+            self.found = 0
+
+    def update(self, pin, found):
+        """Record whether the part on a pin is in place. Returns True if
+        that's a change, False if it's a repeat or a bounce.
+        """
+        now = clock.monotonic()
+
+        with self._lock:
+            bit = self._bits.get(pin)
+            if bit is None:
+                return False
+
+            # too soon after the last change, so it's noise
+            if now - self._lastChange.get(pin, float('-inf')) < self.debounce:
+                return False
+
+            old = self.found
+            new = (old | bit) if found else (old & ~bit)
+            if new == old:
+                return False
+
+            self.found = new
+            self._lastChange[pin] = now
+            return True
+
+    def isFound(self, pin):
+        """Check if the part on a pin is in place"""
+        return bool(self.found & self._bits.get(pin, 0))
+
+    def allFound(self):
+        """Check if every part is in place"""
+        return self.found & self.allMask == self.allMask
+
+    def count(self):
+        """Number of parts in place"""
+        return bin(self.found).count('1')
@@ -0,0 +1,174 @@
+"""Serial link to the NFC readers (circuitpython/code.py)
+
+Each reader streams the UID of every tag it sees, and the Pi tells it which
+tag belongs to its body part, so every reader runs the same firmware. The
+reader still drives its GPIO pin too, so the prop works without the link.
+
+Frames are SYNC, type, payload length, payload, then the xor of the type,
+length and payload bytes.
+"""
+
+import threading
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+SYNC = 0xA5
+UID = 0x01          # from the reader: a tag showed up, payload is its UID
+NO_TAG = 0x02       # from the reader: the tag went away
+HELLO = 0x03        # from the reader: it just started, payload is its saved tag
+SET_TAG = 0x10      # to the reader: the tag to look for, payload is its UID
+
+def encode(kind, payload=b''):
+    """Build a frame"""
+    check = kind ^ len(payload)
+    for b in payload:
+        check ^= b
+    return bytes([SYNC, kind, len(payload)]) + bytes(payload) + bytes([check])
+
+class FrameDecoder(object):
+    """Pulls frames out of a stream of bytes, skipping anything garbled"""
+
+    def __init__(self):
+        """Initialize the decoder"""
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add some bytes, returning a list of (type, payload) frames"""
+        self.buffer.extend(data)
+        frames = list()
+
+        while True:
+            # skip anything before the next sync byte
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                del self.buffer[:]
+                return frames
+            del self.buffer[:start]
+
+            if len(self.buffer) < 4 or len(self.buffer) < self.buffer[2] + 4:
+                return frames
+
+            kind = self.buffer[1]
+            length = self.buffer[2]
+            payload = bytes(self.buffer[3:3 + length])
+            check = kind ^ length
+            for b in payload:
+                check ^= b
+
+            if check == self.buffer[3 + length]:
+                frames.append((kind, payload))
+                del self.buffer[:4 + length]
+            else:
+                # bad frame, so look for the next sync byte
+                del self.buffer[:1]
+
+class ReaderLink(object):
+    """Talks to one reader over its serial port, on a background thread.
+    The port comes and goes when the reader is reset, so we keep trying
+    to reopen it.
+
+    Attributes:
+        port (str): serial device, e.g. /dev/serial/by-id/usb-...-if02
+        tag (bytes): tag the reader should look for
+        callback (function): called with (link, uid) for each tag the
+            reader sees, where uid is None when the tag goes away
+    """
+
+    def __init__(self, port, tag, callback, baudrate=115200, retry=1.0):
+        """Initialize the link (call start() to open the port)"""
+
+        self.port = port
+        self.tag = bytes(tag)
+        self.callback = callback
+        self.baudrate = baudrate
+        self.retry = retry
+
+        self._serial = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread"""
+        if serial is None:
+            raise ImportError('pyserial is needed for reader serial links')
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='ReaderLink ' + self.port,
+                                            daemon=True)
+            self._thread.start()
+
+    @property
+    def connected(self):
+        """True while the reader's port is open, i.e. the reader is running"""
+        return self._serial is not None
+
+    def setTag(self, tag):
+        """Tell the reader to look for a different tag"""
+        self.tag = bytes(tag)
+        self._sendTag()
+
+    def close(self):
+        """Stop the thread and close the port"""
+        self._stopping.set()
+        with self._lock:
+            if self._serial is not None:
+                self._serial.close()
+                self._serial = None
+
+    def _sendTag(self):
+        with self._lock:
+            if self._serial is None:
+                return
+            try:
+                self._serial.write(encode(SET_TAG, self.tag))
+            except serial.SerialException as e:
+                print('Reader', self.port, 'write failed:', e)
+
+    def _run(self):
+        """Background thread -- read frames, reopening the port as needed"""
+        while not self._stopping.is_set():
+            try:
+                port = serial.Serial(self.port, self.baudrate, timeout=0.1)
+            except serial.SerialException:
+                self._stopping.wait(self.retry)
+                continue
+
+            with self._lock:
+                self._serial = port
+
+            # a fresh port means the reader may have rebooted
+            self._sendTag()
+            decoder = FrameDecoder()
+
+            try:
+                while not self._stopping.is_set():
+                    # wait for at least one byte, then take whatever's there
+                    data = port.read(max(1, port.in_waiting))
+                    for kind, payload in decoder.feed(data):
+                        self._handle(kind, payload)
+            except (serial.SerialException, OSError, TypeError) as e:
+                # closing the port from another thread can show up as any of these
+                if not self._stopping.is_set():
+                    print('Reader', self.port, 'disconnected:', e)
+            finally:
+                with self._lock:
+                    if self._serial is port:
+                        self._serial = None
+                port.close()
+
+            self._stopping.wait(self.retry)
+
+    def _handle(self, kind, payload):
+        """Act on a frame from the reader"""
+        if kind == HELLO:
+            if payload != self.tag:
+                self._sendTag()
+        elif kind == UID:
+            self.callback(self, payload)
+        elif kind == NO_TAG:
+            self.callback(self, None)
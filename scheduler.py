@@ -0,0 +1,242 @@
+"""Timers for the zombie prop -- every timer runs on one background thread
+"""
+
+import heapq
+import itertools
+import threading
+import traceback
+from hardware import clock
+
+class Timer(object):
+    """A timer on a Scheduler. Unlike threading.Timer, it can be started
+    again after it fires or is cancelled.
+
+    Attributes:
+        callback (function): called (on the scheduler thread) when it fires
+        delay (float): default delay for start(), in seconds
+        name (str): name to show on the web page (None to keep it quiet)
+        gameTime (bool): True if the timer stops while the game is paused
+        due (float): clock.monotonic() when it fires, None if not running
+        left (float): time left while paused, None if not paused
+    """
+
+    def __init__(self, scheduler, callback, delay=None, name=None, gameTime=False):
+        """Initialize the timer (it doesn't run until start() is called)"""
+
+        self.scheduler = scheduler
+        self.callback = callback
+        self.delay = delay
+        self.name = name
+        self.gameTime = gameTime
+        self.due = None
+        self.left = None
+
+        # bumped on every start or cancel, so old heap entries are ignored
+        self.version = 0
+
+    def start(self, delay=None):
+        """Start the timer, or restart it if it's already running"""
+        self.scheduler._start(self, self.delay if delay is None else delay)
+
+    # rescheduling is just starting over with a new delay
+    reschedule = start
+
+    def cancel(self):
+        """Stop the timer, if it's running"""
+        self.scheduler._cancel(self)
+
+    def active(self):
+        """Check if the timer is running (or paused)"""
+        return self.due is not None or self.left is not None
+
+    def remaining(self):
+        """Seconds until the timer fires, or None if it's not running"""
+        left = self.left
+        if left is not None:
+            return left
+
+        due = self.due
+        if due is None:
+            return None
+
+        return max(0.0, due - clock.monotonic())
+
+class Scheduler(object):
+    """Runs all the prop's timers on a single thread, from a heap
+    ordered by when they're due.
+
+    Timers marked gameTime stop while the game is paused (see pause()
+    and resume()), the rest keep going.
+
+    Attributes:
+        paused (bool): True while game time is paused
+        listener (function): called with each named timer when it starts,
+            stops, fires, pauses or resumes
+    """
+
+    def __init__(self):
+        """Initialize the scheduler (call start() to begin running)"""
+
+        # heap of (due, seq, version, timer)
+        self._heap = []
+        self._seq = itertools.count()
+
+        # game timers waiting for resume()
+        self._paused = set()
+
+        self.paused = False
+        self.listener = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread (or, on the simulated clock's
+        virtual time, let the clock run the timers as it advances)
+        """
+        if getattr(clock, 'virtual', False):
+            clock.attach(self)
+            return
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='Scheduler',
+                                            daemon=True)
+            self._thread.start()
+
+    def timer(self, callback, delay=None, name=None, gameTime=False):
+        """Make a new timer (it doesn't run until it's started)"""
+        return Timer(self, callback, delay, name, gameTime)
+
+    def schedule(self, delay, callback, name=None, gameTime=False):
+        """Call the callback after the delay, in seconds. Returns the Timer."""
+        timer = self.timer(callback, delay, name, gameTime)
+        timer.start()
+        return timer
+
+    def pause(self):
+        """Pause game time -- game timers stop counting down"""
+        with self._cond:
+            if self.paused:
+                return
+            self.paused = True
+
+            now = clock.monotonic()
+            for due, seq, version, timer in self._heap:
+                if timer.gameTime and version == timer.version:
+                    timer.version += 1
+                    timer.left = max(0.0, due - now)
+                    timer.due = None
+                    self._paused.add(timer)
+
+            paused = list(self._paused)
+
+        for timer in paused:
+            self._changed(timer)
+
+    def resume(self):
+        """Resume game time"""
+        with self._cond:
+            if not self.paused:
+                return
+            self.paused = False
+
+            paused = list(self._paused)
+            self._paused.clear()
+
+        for timer in paused:
+            if timer.left is not None:
+                timer.start(timer.left)
+
+    def _start(self, timer, delay):
+        with self._cond:
+            timer.version += 1
+
+            if timer.gameTime and self.paused:
+                timer.due = None
+                timer.left = delay
+                self._paused.add(timer)
+            else:
+                timer.left = None
+                timer.due = clock.monotonic() + delay
+                heapq.heappush(self._heap, (timer.due, next(self._seq),
+                                            timer.version, timer))
+                self._cond.notify()
+
+        self._changed(timer)
+
+    def _cancel(self, timer):
+        with self._cond:
+            if not timer.active():
+                return
+
+            timer.version += 1
+            timer.due = None
+            timer.left = None
+            self._paused.discard(timer)
+
+        self._changed(timer)
+
+    def _changed(self, timer):
+        """Let the listener know about a named timer"""
+        if timer.name is not None and self.listener is not None:
+            self.listener(timer)
+
+    def _head(self):
+        """The heap entry due next, skipping timers that were restarted
+        or cancelled (call with the lock held)
+        """
+        while self._heap and self._heap[0][2] != self._heap[0][3].version:
+            heapq.heappop(self._heap)
+
+        return self._heap[0] if self._heap else None
+
+    def _pop(self):
+        """Take the next timer off the heap (call with the lock held)"""
+        due, seq, version, timer = heapq.heappop(self._heap)
+        timer.due = None
+        return timer
+
+    def _fire(self, timer):
+        try:
+            timer.callback()
+        except Exception:
+            traceback.print_exc()
+
+        self._changed(timer)
+
+    def nextDue(self):
+        """When the next timer is due, or None if there aren't any"""
+        with self._cond:
+            head = self._head()
+            return None if head is None else head[0]
+
+    def runDue(self, now):
+        """Fire every timer that's due by now, on this thread (this is
+        how the simulated clock runs us on virtual time)
+        """
+        while True:
+            with self._cond:
+                head = self._head()
+                if head is None or head[0] > now:
+                    return
+                timer = self._pop()
+
+            self._fire(timer)
+
+    def _run(self):
+        """Background thread -- fire each timer when it's due"""
+        while True:
+            with self._cond:
+                while True:
+                    head = self._head()
+                    if head is None:
+                        self._cond.wait()
+                        continue
+
+                    delay = head[0] - clock.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+
+                timer = self._pop()
+
+            self._fire(timer)
@@ -0,0 +1,481 @@
+"""Pure software stand-ins for the zombie prop hardware, used when
+ZOMBIE_HARDWARE=sim (see hardware.py).
+
+    GPIO -- simulated pins, with readers that can be reset and edges
+            that can be scripted with EdgeScript
+    Adafruit_MotorHAT -- motor controller that records every I2C write
+            in i2cLog instead of talking to the bus
+    mixer -- a mixer that doesn't make any noise, but records what
+            it played in mixer.plays
+    clock -- the time, for the prop code and the simulated hardware
+
+All the logs are timestamped with clock.monotonic(), so latencies can be
+measured by comparing them. The clock runs in real time until it's
+frozen (see SimClock), then time only moves when it's advanced.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+class SimClock(object):
+    """Stand-in for the time module
+
+    Until freeze() is called this is just the real time. After that it's
+    virtual time, which only moves when sleep() or advance() is called --
+    and while it moves, the timers that come due on the way (callLater()
+    and any schedulers attached with attach()) run on the calling thread,
+    in order. That makes simulated games fast and repeatable.
+
+    perf_counter() is always the real time, so it still measures how
+    long the code itself takes.
+
+    Attributes:
+        virtual (bool): True once the clock is frozen
+        now (float): the virtual monotonic time
+    """
+
+    def __init__(self):
+        """Initialize the clock, running in real time"""
+        self.virtual = False
+        self.now = 0.0
+        self._epoch = 0.0
+        self._heap = []
+        self._seq = itertools.count()
+        self._sources = [self]
+        self._lock = threading.RLock()
+
+    def freeze(self):
+        """Switch to virtual time, starting from the real time now"""
+        with self._lock:
+            if not self.virtual:
+                self.virtual = True
+                self.now = time.monotonic()
+                self._epoch = time.time() - self.now
+
+    def attach(self, source):
+        """Run a scheduler's timers on virtual time. The source needs
+        nextDue() (its earliest monotonic due time, or None) and
+        runDue(now) (run everything due by then).
+        """
+        with self._lock:
+            self._sources.append(source)
+
+    def monotonic(self):
+        return self.now if self.virtual else time.monotonic()
+
+    def time(self):
+        return self._epoch + self.now if self.virtual else time.time()
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        if self.virtual:
+            self.advance(seconds)
+        else:
+            time.sleep(seconds)
+
+    def callLater(self, delay, callback):
+        """Call the callback after the delay, in seconds"""
+        if not self.virtual:
+            threading.Timer(delay, callback).start()
+            return
+
+        with self._lock:
+            heapq.heappush(self._heap, (self.now + delay, next(self._seq), callback))
+
+    def advance(self, seconds):
+        """Move virtual time forward, running whatever comes due"""
+        with self._lock:
+            target = self.now + max(0.0, seconds)
+
+            while True:
+                # the source with the earliest timer that's due by target
+                due, source = None, None
+                for s in self._sources:
+                    d = s.nextDue()
+                    if d is not None and d <= target and (due is None or d < due):
+                        due, source = d, s
+
+                if source is None:
+                    break
+
+                self.now = max(self.now, due)
+                source.runDue(self.now)
+
+            self.now = target
+
+    def nextDue(self):
+        return self._heap[0][0] if self._heap else None
+
+    def runDue(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            due, seq, callback = heapq.heappop(self._heap)
+            callback()
+
+class SimGPIO(object):
+    """Stand-in for RPi.GPIO
+
+    A pin reads as whatever we're driving on it (for outputs), otherwise
+    whatever the outside world drives on it, otherwise its pull resistor.
+    Readers attached with addReader() drive their pin low once they're
+    running, and float while their reset line is held low.
+    """
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        """Initialize the simulated pins"""
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything, as if the Pi just booted"""
+        with self._lock:
+            self.mode = None
+            self.pulls = {}         # pin -> pull resistor
+            self.outputs = {}       # pin -> level we're driving
+            self.driven = {}        # pin -> level driven from outside, None = floating
+            self.levels = {}        # pin -> last level, for finding edges
+            self.detect = {}        # pin -> (edge, callback)
+            self.readers = {}       # pin -> reset line (None if unknown)
+            self.bootTime = 0.0     # how long a reader takes to boot, in seconds
+            self.edgeLog = []       # (time, pin, level) for each scripted edge
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        with self._lock:
+            if direction == self.OUT:
+                self.outputs[pin] = self.LOW if initial is None else initial
+            else:
+                self.outputs.pop(pin, None)
+                self.pulls[pin] = pull_up_down
+
+        self._update(pin)
+
+    def input(self, pin):
+        with self._lock:
+            if pin in self.outputs:
+                return self.outputs[pin]
+            if self.driven.get(pin) is not None:
+                return self.driven[pin]
+            return self.HIGH if self.pulls.get(pin) == self.PUD_UP else self.LOW
+
+    def output(self, pin, level):
+        with self._lock:
+            self.outputs[pin] = level
+
+            # readers on a reset line float while it's low, then boot
+            for readerPin, line in self.readers.items():
+                if line is None or line == pin:
+                    if level == self.LOW:
+                        self.driven[readerPin] = None
+                    else:
+                        self._boot(readerPin)
+
+        for readerPin in list(self.readers):
+            self._update(readerPin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if pin in self.detect:
+                raise RuntimeError('Conflicting edge detection already enabled '
+                                   'for this GPIO channel')
+            self.detect[pin] = (edge, callback)
+            self.levels[pin] = self.input(pin)
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            self.detect.pop(pin, None)
+
+    def cleanup(self, channels=None):
+        with self._lock:
+            if channels is None:
+                channels = set(self.outputs) | set(self.pulls) | set(self.detect)
+            elif isinstance(channels, int):
+                channels = [channels]
+
+            for pin in channels:
+                self.outputs.pop(pin, None)
+                self.pulls.pop(pin, None)
+                self.detect.pop(pin, None)
+
+    def addReader(self, pin, resetLine=None):
+        """Attach a running reader to a body part pin. A reader with no
+        reset line gets reset by any of them.
+        """
+        with self._lock:
+            self.readers[pin] = resetLine
+            self.driven[pin] = self.LOW
+
+        self._update(pin)
+
+    def setInput(self, pin, level):
+        """Drive a pin from the outside world, calling any edge callback
+        on this thread (like RPi.GPIO's single callback thread)
+        """
+        with self._lock:
+            self.driven[pin] = level
+            self.edgeLog.append((clock.monotonic(), pin, level))
+
+        self._update(pin)
+
+    def _boot(self, pin):
+        """Bring a reader back up after its reset line is released"""
+        def ready():
+            with self._lock:
+                if self.driven.get(pin) is None:
+                    self.driven[pin] = self.LOW
+            self._update(pin)
+
+        if self.bootTime > 0:
+            clock.callLater(self.bootTime, ready)
+        else:
+            self.driven[pin] = self.LOW
+
+    def _update(self, pin):
+        """Call the edge callback if a pin's level changed"""
+        with self._lock:
+            level = self.input(pin)
+            old = self.levels.get(pin)
+            self.levels[pin] = level
+
+            if pin not in self.detect or old is None or old == level:
+                return
+
+            edge, callback = self.detect[pin]
+            if edge == self.RISING and level == self.LOW:
+                return
+            if edge == self.FALLING and level == self.HIGH:
+                return
+
+        if callback is not None:
+            callback(pin)
+
+class EdgeScript(object):
+    """A scripted list of edges on the simulated GPIO pins
+
+    Attributes:
+        edges (list of (float, int, int)): time (s), pin and level of each edge
+    """
+
+    def __init__(self, edges=()):
+        """Initialize the script"""
+        self.edges = sorted(edges, key=lambda edge: edge[0])
+
+    def add(self, t, pin, level):
+        """Add an edge at time t (seconds from the start of the script)"""
+        self.edges.append((t, pin, level))
+        self.edges.sort(key=lambda edge: edge[0])
+
+    def play(self, gpio=None, realtime=True):
+        """Play the edges on this thread. With realtime=False, the
+        edges happen back to back, as fast as the callbacks allow.
+        """
+        gpio = GPIO if gpio is None else gpio
+        start = clock.monotonic()
+
+        for t, pin, level in self.edges:
+            if realtime:
+                delay = start + t - clock.monotonic()
+                if delay > 0:
+                    clock.sleep(delay)
+
+            gpio.setInput(pin, level)
+
+# every I2C write to a simulated motor controller, as (time, addr, reg, value)
+i2cLog = []
+
+class SimI2CDevice(object):
+    """An I2C device that just remembers what was written to it"""
+
+    def __init__(self, address):
+        """Initialize the device"""
+        self.address = address
+        self.registers = {}
+
+    def write8(self, register, value):
+        self.registers[register] = value & 0xFF
+        i2cLog.append((clock.monotonic(), self.address, register, value & 0xFF))
+
+    def writeList(self, register, data):
+        # auto-increment, like the PCA9685
+        now = clock.monotonic()
+        for i, value in enumerate(data):
+            self.registers[register + i] = value & 0xFF
+            i2cLog.append((now, self.address, register + i, value & 0xFF))
+
+    def readU8(self, register):
+        return self.registers.get(register, 0)
+
+class SimPWM(object):
+    """Stand-in for the PCA9685 PWM driver used by Adafruit_MotorHAT"""
+    MODE1 = 0x00
+    MODE2 = 0x01
+    PRESCALE = 0xFE
+    LED0_ON_L = 0x06
+    ALL_LED_ON_L = 0xFA
+    ALLCALL = 0x01
+    OUTDRV = 0x04
+
+    def __init__(self, address):
+        """Initialize the driver, writing the same registers as the real one"""
+        self.i2c = SimI2CDevice(address)
+        self.setAllPWM(0, 0)
+        self.i2c.write8(self.MODE2, self.OUTDRV)
+        self.i2c.write8(self.MODE1, self.ALLCALL)
+
+    def setPWMFreq(self, freq):
+        prescale = int(25000000.0 / 4096.0 / float(freq) - 0.5)
+        oldmode = self.i2c.readU8(self.MODE1)
+        self.i2c.write8(self.MODE1, (oldmode & 0x7F) | 0x10)
+        self.i2c.write8(self.PRESCALE, prescale)
+        self.i2c.write8(self.MODE1, oldmode)
+        self.i2c.write8(self.MODE1, oldmode | 0x80)
+
+    def setPWM(self, channel, on, off):
+        reg = self.LED0_ON_L + 4 * channel
+        self.i2c.write8(reg, on & 0xFF)
+        self.i2c.write8(reg + 1, on >> 8)
+        self.i2c.write8(reg + 2, off & 0xFF)
+        self.i2c.write8(reg + 3, off >> 8)
+
+    def setAllPWM(self, on, off):
+        reg = self.ALL_LED_ON_L
+        self.i2c.write8(reg, on & 0xFF)
+        self.i2c.write8(reg + 1, on >> 8)
+        self.i2c.write8(reg + 2, off & 0xFF)
+        self.i2c.write8(reg + 3, off >> 8)
+
+class Adafruit_DCMotor(object):
+    """Stand-in for Adafruit_DCMotor, with the same pin mapping"""
+
+    # (PWM, IN2, IN1) pins for each motor
+    PINS = [(8, 9, 10), (13, 12, 11), (2, 3, 4), (7, 6, 5)]
+
+    def __init__(self, controller, num):
+        """Initialize the motor"""
+        self.MC = controller
+        self.motornum = num
+        self.PWMpin, self.IN2pin, self.IN1pin = self.PINS[num]
+
+    def run(self, command):
+        if command == Adafruit_MotorHAT.FORWARD:
+            self.MC.setPin(self.IN2pin, 0)
+            self.MC.setPin(self.IN1pin, 1)
+        if command == Adafruit_MotorHAT.BACKWARD:
+            self.MC.setPin(self.IN1pin, 0)
+            self.MC.setPin(self.IN2pin, 1)
+        if command == Adafruit_MotorHAT.RELEASE:
+            self.MC.setPin(self.IN1pin, 0)
+            self.MC.setPin(self.IN2pin, 0)
+
+    def setSpeed(self, speed):
+        speed = max(0, min(255, speed))
+        self.MC._pwm.setPWM(self.PWMpin, 0, speed * 16)
+
+class Adafruit_MotorHAT(object):
+    """Stand-in for Adafruit_MotorHAT"""
+    FORWARD = 1
+    BACKWARD = 2
+    BRAKE = 3
+    RELEASE = 4
+
+    def __init__(self, addr=0x60, freq=1600, i2c=None, i2c_bus=None):
+        """Initialize the controller"""
+        self._frequency = freq
+        self.motors = [Adafruit_DCMotor(self, m) for m in range(4)]
+        self._pwm = SimPWM(addr)
+        self._pwm.setPWMFreq(freq)
+
+    def setPin(self, pin, value):
+        if value == 0:
+            self._pwm.setPWM(pin, 0, 4096)
+        if value == 1:
+            self._pwm.setPWM(pin, 4096, 0)
+
+    def getMotor(self, num):
+        return self.motors[num - 1]
+
+class SimMixer(object):
+    """Stand-in for pygame.mixer that plays nothing
+
+    Attributes:
+        plays (list of (float, str, int)): time, file and channel of each
+            sound played (channel is None for Sound.play())
+    """
+
+    def __init__(self):
+        """Initialize the mixer"""
+        self._init = None
+        self._numChannels = 8
+        self._reserved = 0
+        self.plays = []
+
+        mixer = self
+
+        class Sound(object):
+            """A sound that remembers its file name"""
+
+            def __init__(self, filename):
+                self.filename = filename
+                self.volume = 1.0
+
+            def set_volume(self, volume):
+                self.volume = volume
+
+            def play(self):
+                mixer.plays.append((clock.monotonic(), self.filename, None))
+
+        class Channel(object):
+            """A mixer channel"""
+
+            def __init__(self, num):
+                self.num = num
+
+            def play(self, sound):
+                mixer.plays.append((clock.monotonic(), sound.filename, self.num))
+
+        self.Sound = Sound
+        self.Channel = Channel
+
+    def init(self, frequency=44100, size=-16, channels=2, buffer=512):
+        if self._init is None:
+            self._init = (frequency, size, channels)
+
+    def get_init(self):
+        return self._init
+
+    def quit(self):
+        self._init = None
+
+    def get_num_channels(self):
+        return self._numChannels
+
+    def set_num_channels(self, count):
+        self._numChannels = count
+
+    def set_reserved(self, count):
+        self._reserved = count
+
+# the simulated hardware
+clock = SimClock()
+GPIO = SimGPIO()
+mixer = SimMixer()
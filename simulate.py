@@ -0,0 +1,176 @@
+"""Run simulated games of the zombie prop on the software hardware backend
+
+    python simulate.py --games 1000
+
+Each game resets the prop from zombie.conf, then finds every body part in
+a random (seeded) order by scripting the reader pins, and records how long
+each GPIO edge took to reach the magnets and the sound.
+
+The games run on the simulated clock's virtual time, so nothing really
+sleeps -- waits and timers (like the magnet ramps) just move the clock
+along. The latencies are in virtual time too, which makes them the same
+on every run: they show what waits on what, not how fast this machine
+is. For the real cost of the code, see --metrics or the benchmark.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import time
+
+# this has to happen before the prop modules pick their hardware
+os.environ['ZOMBIE_HARDWARE'] = 'sim'
+os.environ.setdefault('ZOMBIE_PATH', os.path.dirname(os.path.abspath(__file__)) + '/')
+
+import config
+import metrics
+import sim_hardware
+import zombie
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return float('nan')
+
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values))) - 1))
+    return values[index]
+
+def magnetWrites(part, log):
+    """Times of the writes to a body part's magnet PWM registers"""
+    registers = set()
+    for m in part.magnets:
+        registers.add((m.bus.i2c.address, m.bus.LED0_ON_L + 4 * m.PWMpin))
+
+    return [t for t, addr, reg, value in log if (addr, reg) in registers]
+
+def rampTime(part):
+    """How long a part's magnet ramp takes, in seconds"""
+    return sum(duration or 0.0 for speed, duration in part.rampProfile)
+
+def setup():
+    """Set up the simulated hardware and read the config file"""
+    sim_hardware.clock.freeze()
+    sim_hardware.GPIO.setmode(sim_hardware.GPIO.BCM)
+    zombie.sound_engine.init()
+    config.magnetTimer = config.scheduler.timer(zombie.magnetTimer_callback, 7200.0,
+                                                name='Magnets off', gameTime=True)
+    config.scheduler.start()
+
+    zombie.configZombie()
+    for pin in zombie.bodyParts:
+        sim_hardware.GPIO.addReader(pin)
+
+def playGame(rng, realtime=False, spacing=0.0):
+    """Play one game, returning the (magnet, hold, sound) latency of each
+    part, where hold is when its magnets reached holding power
+    """
+    gpio = sim_hardware.GPIO
+
+    # reset, like ZombieState.RESET does
+    zombie.clearEvents()
+    zombie.configZombie()
+    zombie.wakeup()
+    config.gameLog.startGame()
+
+    # find the parts in a random order
+    pins = list(zombie.bodyParts)
+    rng.shuffle(pins)
+    script = sim_hardware.EdgeScript()
+    for i, pin in enumerate(pins):
+        script.add(i * spacing, pin, gpio.HIGH)
+
+    edgeStart = len(gpio.edgeLog)
+    i2cStart = len(sim_hardware.i2cLog)
+    playStart = len(sim_hardware.mixer.plays)
+    script.play(realtime=realtime)
+
+    # let the magnet ramps finish
+    sim_hardware.clock.advance(max(rampTime(part) for part in zombie.bodyParts.values()))
+    if not config.magnetScheduler.flush(0):
+        raise RuntimeError('Magnet ramps still running')
+
+    if not zombie.partTable.allFound():
+        raise RuntimeError('Only found %d of %d parts'
+                           % (zombie.partTable.count(), len(zombie.bodyParts)))
+    config.gameLog.log(zombie.game_log.ALL_FOUND)
+    config.gameLog.log(zombie.game_log.UNLOCK)
+
+    writes = sim_hardware.i2cLog[i2cStart:]
+    plays = sim_hardware.mixer.plays[playStart:]
+
+    latencies = []
+    for t, pin, level in gpio.edgeLog[edgeStart:]:
+        part = zombie.bodyParts[pin]
+        times = [w - t for w in magnetWrites(part, writes) if w >= t]
+        magnet = times[0] if times else float('nan')
+        hold = times[-1] if times else float('nan')
+        sound = next((p - t for p, filename, channel in plays
+                      if p >= t and channel == part.channel.num), float('nan'))
+        latencies.append((magnet, hold, sound))
+
+    # put the readers back to "no tag" for the next game
+    for pin in pins:
+        gpio.setInput(pin, gpio.LOW)
+    for part in zombie.bodyParts.values():
+        part.drop()
+
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spacing', type=float, default=0.0,
+                        help='seconds between finding parts')
+    parser.add_argument('--realtime', action='store_true',
+                        help='play edges at their scripted times instead of back to back')
+    parser.add_argument('--verbose', action='store_true',
+                        help="show the prop's own messages")
+    parser.add_argument('--log', help='write a game log to this file')
+    parser.add_argument('--metrics', action='store_true',
+                        help="print the prop's metrics at the end")
+    args = parser.parse_args()
+
+    if args.log:
+        config.gameLog.filename = args.log
+        config.gameLog.open()
+
+    rng = random.Random(args.seed)
+
+    # the prop prints a lot, which would swamp the timing
+    quiet = contextlib.nullcontext() if args.verbose \
+        else contextlib.redirect_stdout(io.StringIO())
+
+    magnet = []
+    hold = []
+    sound = []
+    with quiet:
+        setup()
+
+        start = time.monotonic()
+        try:
+            for game in range(args.games):
+                for m, h, s in playGame(rng, args.realtime, args.spacing):
+                    magnet.append(m)
+                    hold.append(h)
+                    sound.append(s)
+        finally:
+            config.magnetTimer.cancel()
+        elapsed = time.monotonic() - start
+
+    print('%d games in %.2f s (%.0f games/min)'
+          % (args.games, elapsed, args.games * 60.0 / elapsed))
+    for name, values in (('edge to magnet', magnet), ('edge to hold', hold),
+                         ('edge to sound', sound)):
+        print('%-15s p50 %8.3f ms  p95 %8.3f ms  p99 %8.3f ms'
+              % (name, percentile(values, 50) * 1000,
+                 percentile(values, 95) * 1000, percentile(values, 99) * 1000))
+
+    if args.metrics:
+        print(metrics.registry.render(), end='')
+
+if __name__ == '__main__':
+    main()
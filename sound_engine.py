@@ -0,0 +1,61 @@
+"""Sound engine for the zombie prop -- keeps decoded sounds around
+between resets and plays them with as little delay as possible
+"""
+
+import os
+from hardware import mixer
+
+# mixer settings -- a small buffer means a short delay before a sound starts
+FREQUENCY = 44100
+SIZE = -16
+CHANNELS = 2
+BUFFER = 512
+
+# decoded sounds, indexed by file name, each is (mtime, Sound)
+sounds = {}
+
+# mixer channels reserved for each body part, indexed by name
+channels = {}
+
+def init():
+    """Start the mixer with a small buffer, if it isn't already running
+    """
+    if mixer.get_init() is None:
+        mixer.init(frequency=FREQUENCY, size=SIZE, channels=CHANNELS,
+                   buffer=BUFFER)
+
+        # sounds and channels from an old mixer are no good
+        sounds.clear()
+        channels.clear()
+
+def load(filename):
+    """Get the decoded sound for a file, only decoding it again
+    if the file has changed since last time
+    """
+    mtime = os.path.getmtime(filename)
+
+    cached = sounds.get(filename)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    # decode the whole file now, so playing it later is quick
+    sound = mixer.Sound(filename)
+    sound.set_volume(1.0)
+    sounds[filename] = (mtime, sound)
+
+    return sound
+
+def channel(name):
+    """Get the mixer channel reserved for a body part, so sounds for
+    different parts never cut each other off
+    """
+    if name not in channels:
+        # reserve one more channel; mixer.Sound.play() won't steal these
+        num = len(channels) + 1
+        if mixer.get_num_channels() < num:
+            mixer.set_num_channels(num)
+        mixer.set_reserved(num)
+
+        channels[name] = mixer.Channel(num - 1)
+
+    return channels[name]
@@ -0,0 +1,190 @@
+"""Background publisher for sending body part and timer status to the
+web server
+"""
+
+import collections
+import threading
+import time
+import requests
+import metrics
+
+# how the posts to the web server are doing
+postTime = metrics.histogram('zombie_status_post_seconds',
+                             'Time to post a batch of status updates')
+postFailures = metrics.counter('zombie_status_post_failures',
+                               'Status posts that failed and were retried')
+postUpdates = metrics.counter('zombie_status_updates',
+                              'Status updates sent to the web server')
+
+def rejected(error):
+    """Whether a failed post was refused by the web server (a 4xx), as
+    opposed to the server being down or broken
+    """
+    response = getattr(error, 'response', None)
+    return response is not None and 400 <= response.status_code < 500
+
+class StatusPublisher(object):
+    """Sends status updates to the web server from a background thread,
+    so the hardware code never waits on HTTP.
+
+    Updates are coalesced by part (or timer) name -- if a part changes
+    twice before we get a chance to send, only the latest status goes out.
+
+    Attributes:
+        session (requests.Session): session for talking to web server
+        url (str): base url of the web server
+        maxPending (int): most parts and timers we'll hold updates for
+        timeout (float): timeout for each HTTP request, in seconds
+    """
+
+    def __init__(self, session, url='http://localhost', maxPending=64,
+                 timeout=2.0, minBackoff=0.5, maxBackoff=30.0):
+        """Initialize the publisher (call start() to begin sending)"""
+
+        self.session = session
+        self.url = url
+        self.maxPending = maxPending
+        self.timeout = timeout
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+
+        # pending updates, indexed by (type, name), oldest first -- these
+        # all go out together in one /bulk request
+        self._pending = collections.OrderedDict()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._running = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+
+        self._thread = threading.Thread(target=self._run, name='StatusPublisher',
+                                        daemon=True)
+        self._thread.start()
+
+    def insert(self, name, status):
+        """Queue a new body part for the web page"""
+        self._queue({'type' : 'bodypart', 'name' : name, 'status' : status,
+                     'insert' : True})
+
+    def update(self, name, status):
+        """Queue a status change for an existing body part"""
+        self._queue({'type' : 'bodypart', 'name' : name, 'status' : status,
+                     'insert' : False})
+
+    def timer(self, name, deadline, remaining):
+        """Queue a countdown for the web page. deadline is when the timer
+        fires (from time.time()), or None if it's stopped or paused;
+        remaining is the seconds left, or None if it's stopped.
+        """
+        self._queue({'type' : 'timer', 'name' : name, 'deadline' : deadline,
+                     'remaining' : remaining, 'insert' : True})
+
+    def _queue(self, update):
+        """Add an update to the pending list -- never blocks on the network"""
+        key = (update['type'], update['name'])
+        with self._cond:
+            old = self._pending.pop(key, None)
+
+            # an unsent insert has to stay an insert, or the row never appears
+            if old is not None and old['insert']:
+                update['insert'] = True
+
+            # if we're full, the oldest update loses
+            if len(self._pending) >= self.maxPending:
+                self._pending.popitem(last=False)
+
+            self._pending[key] = update
+            self._cond.notify()
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been sent.
+        Returns True if we're caught up, False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout=2.0):
+        """Send whatever is left and stop the thread"""
+        self.flush(timeout)
+
+        with self._cond:
+            self._running = False
+            self._stopping.set()
+            self._cond.notify_all()
+
+    def _run(self):
+        """Background thread -- send batches of updates, backing off
+        while the web server is down
+        """
+        backoff = self.minBackoff
+
+        while True:
+            # wait for something to send
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or not self._running)
+                if not self._pending:
+                    return
+
+                batch = list(self._pending.values())
+                self._pending.clear()
+                self._busy = True
+
+            try:
+                self._send(batch)
+                backoff = self.minBackoff
+
+            except requests.RequestException as e:
+                # a 4xx means the web server won't ever take these, and
+                # sending them again would hold up everything behind them
+                if rejected(e):
+                    print('Web server rejected updates, dropping them:', e)
+                    continue
+
+                print('Web update failed, retrying in', backoff, 's:', e)
+                postFailures.inc()
+
+                with self._cond:
+                    # don't hang around retrying at shutdown
+                    if not self._running:
+                        self._pending.clear()
+                        continue
+
+                    # put the batch back, unless something newer showed up
+                    # (which still has to be an insert if ours was)
+                    for update in reversed(batch):
+                        key = (update['type'], update['name'])
+                        newer = self._pending.get(key)
+                        if newer is None:
+                            self._pending[key] = update
+                            self._pending.move_to_end(key, last=False)
+                        elif update['insert']:
+                            newer['insert'] = True
+
+                # wait before retrying (new updates just pile up meanwhile)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.maxBackoff)
+
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _send(self, batch):
+        """Send a batch of updates to the web server in one request"""
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url + '/bulk', json=batch,
+                                         timeout=self.timeout)
+            response.raise_for_status()
+        finally:
+            postTime.observe(time.perf_counter() - start)
+
+        postUpdates.inc(len(batch))
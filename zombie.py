@@ -5,15 +5,20 @@ import array
 import time
 import atexit
 import csv
-from Adafruit_MotorHAT import Adafruit_MotorHAT, Adafruit_DCMotor
+from hardware import GPIO, Adafruit_MotorHAT, Adafruit_DCMotor, mixer, clock
 import body_part
-import RPi.GPIO as GPIO
-from pygame import mixer
+import game_log
+import magnet_control
+import metrics
+import motor_bus
+import part_table
+import reader_link
+import sound_engine
 import os
 import paho.mqtt.client as mqtt
 from enum import Enum
 import config
-from threading import Timer
+import queue
 import requests
 
 class ZombieState(Enum):
@@ -25,24 +30,87 @@ class ZombieState(Enum):
     UNLOCK = 4
     PAUSE = 5
     
+class ZombieEvent(Enum):
+    """Events that drive the state machine"""
+    PART_FOUND = 0
+    RESET = 1
+    UNLOCK = 2
+    MAGNET_TIMEOUT = 3
+    RESTART = 4
+    
+# state to move to when an event arrives (PART_FOUND is handled separately)
+transitions = {
+    ZombieEvent.RESET : ZombieState.RESET,
+    ZombieEvent.UNLOCK : ZombieState.DROP_PARTS,
+    ZombieEvent.MAGNET_TIMEOUT : ZombieState.DROP_PARTS,
+    ZombieEvent.RESTART : ZombieState.RESET,
+}
+
 # path to source code directory
-path = "/home/pi/src/zombie/"
+path = os.environ.get('ZOMBIE_PATH', "/home/pi/src/zombie/")
 
 # dict of body parts, indexed by input pin
 bodyParts = {}
 
-# count of number of body parts we've found
-numPartsFound = 0
+# config file rows used to build the body parts, indexed by input pin
+configRows = {}
+
+# motor controller buses, indexed by I2C address (kept between resets)
+motorControllers = {}
+
+# active low reset lines for the Trinket readers
+resetPins = [25, 10]
+
+# longest we'll wait for the readers to wake up, in seconds
+wakeupTimeout = float(os.environ.get('ZOMBIE_WAKEUP_TIMEOUT', '5.0'))
+
+# how long a reader keeps its pin high after its tag goes away (MISSES
+# reads in circuitpython/code.py), in seconds
+tagGoneTime = 0.15
+
+# body part pins whose edges we ignore while waking up the readers
+wakingPins = set()
+
+# seconds between dropping parts, for parts with no dropDelay in the config
+defaultDropSpacing = float(os.environ.get('ZOMBIE_DROP_SPACING', '1.0'))
+
+# seconds after the drop starts to unlock (None = after the last part drops)
+unlockDelay = os.environ.get('ZOMBIE_UNLOCK_DELAY')
+if unlockDelay:
+    unlockDelay = float(unlockDelay)
+else:
+    unlockDelay = None
+
+# which body parts we've found
+partTable = part_table.PartTable(debounce=0.05)
 
 # current state
 state = ZombieState.RESET
 
+# events posted by callbacks and timers, consumed by main loop
+events = queue.Queue()
+
 # mqtt client
 client = mqtt.Client()
 
 # timer to restart
 restartTimer = None
 
+# local port for scraping the metrics (0 to turn it off)
+metricsPort = int(os.environ.get('ZOMBIE_METRICS_PORT', '9101'))
+
+# game states last from milliseconds (FOUND_ALL) to hours (LOCKED)
+stateTime = metrics.histogram(
+    'zombie_state_seconds', 'Time spent in each state, including its work',
+    ['state'], buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800,
+                        3600, 7200))
+
+partsFound = metrics.counter('zombie_parts_found',
+                             'Body parts found, by what saw them first',
+                             ['source'])
+wrongTags = metrics.counter('zombie_wrong_tags',
+                            'Wrong tags seen by the readers', ['part'])
+
 def on_connect(client, userdata, flags, rc):
     """Callback for connecting to mqtt broker
     """
@@ -55,55 +123,97 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """Callback for when we receive a message
     """
-    global state
-    
     command = str(msg.payload, encoding='utf-8')
     
     if command == "reset":
-        state = ZombieState.RESET
+        config.gameLog.log(game_log.RESET)
+        events.put(ZombieEvent.RESET)
     elif command == "unlock":
-        state = ZombieState.DROP_PARTS
+        config.gameLog.log(game_log.UNLOCK_COMMAND)
+        events.put(ZombieEvent.UNLOCK)
+    elif command == "pause":
+        config.gameLog.log(game_log.PAUSE)
+        config.scheduler.pause()
+    elif command == "resume":
+        config.gameLog.log(game_log.RESUME)
+        config.scheduler.resume()
         
 
 def magnetTimer_callback():
     """Called when magnets left on too long
     """
-    global state
-    
     print("Timer expired")
-    state = ZombieState.DROP_PARTS
+    config.gameLog.log(game_log.MAGNET_TIMEOUT)
+    events.put(ZombieEvent.MAGNET_TIMEOUT)
                
 def restartTimer_callback():
     """Called after unlock, to restart the prop
     """
-    global state
-    
     print("Restarting")
-    state = ZombieState.RESET
+    events.put(ZombieEvent.RESTART)
+    
+def timerChanged(timer):
+    """Called when a named timer starts, stops or pauses, to update
+    the countdown on the web page
+    """
+    remaining = timer.remaining()
+    deadline = None
+    if timer.due is not None:
+        deadline = clock.time() + remaining
+        
+    config.statusPublisher.timer(timer.name, deadline, remaining)
     
 def bodyPart_callback(channel):
     """Callback for GPIO pin, called whenever a
     body part is found or removed.
     channel = GPIO channel
     """
-    global numPartsFound
     global bodyParts
     
-    # found or removed?
+    edge = time.perf_counter()
+    
+    # ignore edges while we're waking up the readers
+    if channel in wakingPins:
+        return
+    
+    # found or removed? (the table ignores repeats and bounces)
     if GPIO.input(channel):
         # rising edge, make sure we haven't already found this one
-        if not bodyParts[channel].isFound():
-            bodyParts[channel].foundMyTag()
-        
-            numPartsFound = numPartsFound + 1
+        if partTable.update(channel, True):
+            bodyParts[channel].foundMyTag(edge)
+            partsFound.labels('gpio').inc()
+            
+            # wake up the main loop
+            events.put(ZombieEvent.PART_FOUND)
         
 #    else:
 #        # falling edge, so check if we already removed this one
-#        if bodyParts[channel].isFound():
+#        if partTable.update(channel, False):
 #            # still there, so remove it
 #            bodyParts[channel].tagRemoved(True)
-#            
-#            numPartsFound = numPartsFound - 1
+        
+def reader_callback(channel, uid):
+    """Callback for a reader's serial link, called with the UID of each
+    tag the reader sees (None when it goes away). This usually beats the
+    GPIO edge for the right tag, and tells us about the wrong ones.
+    channel = GPIO channel of the reader's body part
+    """
+    seen = time.perf_counter()
+    
+    part = bodyParts.get(channel)
+    if part is None or channel in wakingPins or uid is None:
+        return
+    
+    if uid != bytes(part.tag):
+        print(part.name, 'saw the wrong tag:', list(uid))
+        wrongTags.labels(part.name).inc()
+        return
+    
+    # same as the rising edge (the table makes sure only one of us wins)
+    if partTable.update(channel, True):
+        part.foundMyTag(seen)
+        partsFound.labels('serial').inc()
+        events.put(ZombieEvent.PART_FOUND)
         
 def init():
     """System level initialization.
@@ -113,6 +223,9 @@ def init():
         - set up mqtt callbacks
     """
     global client
+    global restartTimer
+    
+    GPIO.setmode(GPIO.BCM)
     
     # create the directory /tmp/zombie
     try:
@@ -136,228 +249,403 @@ def init():
     client.connect("localhost")
     client.loop_start()
     
-    # timer for turning off the magnets after 2 hours
-    config.magnetTimer = Timer(7200.0, magnetTimer_callback)
+    # start running the timers (and magnet ramps) in the background
+    config.scheduler.listener = timerChanged
+    config.scheduler.start()
+    
+    # start logging game events (the game runs fine without it)
+    try:
+        config.gameLog.open()
+    except OSError as e:
+        print('No game log:', e)
+    
+    # let prometheus (or curl) see how we're doing -- only on this machine
+    if metricsPort:
+        try:
+            metrics.serve(metricsPort)
+        except OSError as e:
+            print('No metrics on port', metricsPort, ':', e)
+    
+    # start sending status updates to the web server in the background
+    config.statusPublisher.start()
+    atexit.register(config.statusPublisher.close)
+    
+    # timer for turning off the magnets after 2 hours of game time
+    config.magnetTimer = config.scheduler.timer(magnetTimer_callback, 7200.0,
+                                                name='Magnets off', gameTime=True)
+    
+    # timer to reset the prop after it's unlocked
+    restartTimer = config.scheduler.timer(restartTimer_callback, 1800.0,
+                                          name='Restart')
     
     # clear the web database
     config.session.get('http://localhost/init')
     
 
     
+def readerReady(pin):
+    """Check if the reader on a body part pin is up and running. A running
+    reader drives its pin low, but one that's in reset or still booting
+    leaves it floating, so with the pull-up on it reads high. A running
+    reader that sees its tag drives it high too, but if it has a serial
+    link, the link tells us it's running.
+    """
+    if GPIO.input(pin) == GPIO.LOW:
+        return True
+    
+    reader = bodyParts[pin].reader
+    return reader is not None and reader.connected
+    
+def waitForReaders(pins, timeout):
+    """Wait until all the readers are running, or until we time out.
+    Returns the pins whose readers never came up.
+    """
+    deadline = clock.monotonic() + timeout
+    
+    waiting = list(pins)
+    while waiting:
+        waiting = [pin for pin in waiting if not readerReady(pin)]
+        if waiting and clock.monotonic() >= deadline:
+            break
+        
+        clock.sleep(0.01)
+        
+    return waiting
+    
 def wakeup():
-    """Wakeup the Trinket microcontrollers using the reset signals
+    """Wakeup the Trinket microcontrollers using the reset signals. Only
+    the readers that aren't already running get reset, and we return as
+    soon as they've all come up (or after wakeupTimeout seconds).
     """
+    pins = list(bodyParts.keys())
     
-    # set pins as outputs
-    resetPin1 = 25
-    resetPin2 = 10
+    # ignore the edges we're about to cause on the body part pins
+    wakingPins.update(pins)
     
-    GPIO.setmode(GPIO.BCM)
+    try:
+        # pull the pins up, so we can tell who's driving them low
+        for pin in pins:
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        clock.sleep(0.001)
+        
+        asleep = [pin for pin in pins if not readerReady(pin)]
+        if asleep:
+            # parts that were just let go can still be on their readers,
+            # so give the readers time to notice before resetting them
+            clock.sleep(tagGoneTime)
+            asleep = [pin for pin in asleep if not readerReady(pin)]
+        if not asleep:
+            return
+        
+        # figure out which reset lines to pull (all of them if we don't know)
+        lines = set()
+        for pin in asleep:
+            if configRows[pin].get('resetPin'):
+                lines.add(int(configRows[pin]['resetPin']))
+            else:
+                lines.update(resetPins)
+        
+        # every reader on those lines gets reset, so we wait for all of them
+        woken = [pin for pin in pins
+                 if not configRows[pin].get('resetPin')
+                 or int(configRows[pin]['resetPin']) in lines]
+        
+        print('Waking up readers on pins', woken)
+        
+        # set reset signals low (active low reset)
+        for line in lines:
+            GPIO.setup(line, GPIO.OUT)
+            GPIO.output(line, GPIO.LOW)
+        
+        # wait a bit
+        clock.sleep(0.01)
+        
+        # set them high again and cleanup the pins
+        for line in lines:
+            GPIO.output(line, GPIO.HIGH)
+        GPIO.cleanup(list(lines))
+        
+        # wait for them to boot
+        missing = waitForReaders(woken, wakeupTimeout)
+        if missing:
+            print('Readers on pins', missing, 'did not wake up')
+        
+    finally:
+        # back to normal
+        for pin in pins:
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+        wakingPins.difference_update(pins)
+    
+def getMagnet(addr, channel):
+    """Get a magnet on one of the motor controllers, creating the
+    controller the first time we see its address
+    """
+    # add motor controller chip to dict if needed (batching its writes)
+    if not addr in motorControllers:
+        motorControllers[addr] = motor_bus.MotorBus(
+            Adafruit_MotorHAT(addr=addr, freq=100))
+        
+    # get channel on this motor controller
+    magnet = motorControllers[addr].getMotor(channel)
+    
+    # make sure it's off to start
+    magnet.run(Adafruit_MotorHAT.RELEASE)
+    magnet.flush()
     
-    GPIO.setup(resetPin1, GPIO.OUT)
-    GPIO.setup(resetPin2, GPIO.OUT)
+    return magnet
     
-    # set reset signals low (active low reset)
-    GPIO.output(resetPin1, GPIO.LOW)
-    GPIO.output(resetPin2, GPIO.LOW)
+def buildPart(row):
+    """Build a body part from a row of the config file
+    """
+    name = str(row['name'])
+    pin = int(row['pin'])
     
-    # wait a bit
-    time.sleep(0.25)
+    # release the GPIO poin if we were already using it
+    try:
+        GPIO.remove_event_detect(pin)
+    except RuntimeError:
+        pass
     
-    # set them high again
-    GPIO.output(resetPin1, GPIO.HIGH)
-    GPIO.output(resetPin2, GPIO.HIGH)
+    # set up the GPIO pin as input with callback
+    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+    GPIO.add_event_detect(pin, GPIO.BOTH, callback=bodyPart_callback)
     
-    # wait another bit
-    time.sleep(0.25)
+    # parse the tag to get a byte array
+    tag = array.array('B', [int(x) for x in row['tag'].split(' ')])
     
-    # cleanup the pins
-    GPIO.cleanup( [resetPin1, resetPin2] )
+    # get the sound file
+    soundfile = path + 'sounds/' + str(row['soundfile'])
     
-    # initialize sound device
-    mixer.init()
+    # get magnets, adding motor controllers to dict, if needed
+    magnets = list()
+    if row['motorAddr1']:
+        magnets.append(getMagnet(int(row['motorAddr1']),
+                                 int(row['motorChannel1'])))
+        
+    if row['motorAddr2']:
+        magnets.append(getMagnet(int(row['motorAddr2']),
+                                 int(row['motorChannel2'])))
+    
+    # how to ramp up the magnets when the part is found
+    rampProfile = magnet_control.parseProfile(row.get('rampProfile'))
+    
+    # when to drop the part, in seconds after the drop starts
+    dropDelay = None
+    if row.get('dropDelay'):
+        dropDelay = float(row['dropDelay'])
+    
+    # serial link to the reader, which tells it what tag to look for
+    reader = None
+    if row.get('serial'):
+        reader = reader_link.ReaderLink(row['serial'], tag,
+                                        lambda link, uid: reader_callback(pin, uid))
+        reader.start()
+    
+    # create this body part
+    return body_part.BodyPart(name, pin, magnets, tag, soundfile, rampProfile,
+                              dropDelay, reader)
+    
+def removePart(part):
+    """Stop using a body part that's no longer in the config file
+    """
+    try:
+        GPIO.remove_event_detect(part.pin)
+    except RuntimeError:
+        pass
     
-    # wait a little for things to settle
-    time.sleep(3.0)
+    part.remove()
     
 def configZombie():
-    """Read the config file and build the different body parts
+    """Read the config file and update the body parts. Parts whose
+    config hasn't changed keep their GPIO, magnets and sound, and are
+    just reset. Only new or changed parts are built from scratch.
     """
     global bodyParts
     global restartTimer
     
     # stop the restart timer, if running
-    if (restartTimer is not None) and (restartTimer.is_alive()):
+    if restartTimer is not None:
         restartTimer.cancel()
 
-    motorControllers  = dict()     # system has more than one motor controller
-    
-    bodyParts.clear()
-    
     print('Reading the config file')
+    rows = dict()
     with open(path + 'zombie.conf') as configfile:
         reader = csv.DictReader(configfile)
-        for row in reader:            
-            name = str(row['name'])
-            pin = int(row['pin'])
-            
-            # release the GPIO poin if we were already using it
-            try:
-                GPIO.remove_event_detect(pin)
-            except RuntimeError:
-                pass
-            
-            # set up the GPIO pin as input with callback
-            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-            GPIO.add_event_detect(pin, GPIO.BOTH, callback=bodyPart_callback)
-            
-            # parse the tag to get a byte array
-            tag = array.array('B', [int(x) for x in row['tag'].split(' ')])
-            
-            # get the sound file
-            soundfile = path + 'sounds/' + str(row['soundfile'])
-            
-            # get magnets, adding motor controllers to dict, if needed
-            magnets = list()
-            magnet1 = None
-            magnet2 = None
-            if row['motorAddr1'] is not None:
-                motorAddr1 = int(row['motorAddr1'])
-                
-                # add motor controller chip to dict if needed
-                if not motorAddr1 in motorControllers:
-                    motorControllers[motorAddr1] = Adafruit_MotorHAT(addr=motorAddr1,
-                                                                     freq=100)
-                
-                # get channel on this motor controller
-                motorChannel1 = int(row['motorChannel1'])
-                magnet1 = motorControllers[motorAddr1].getMotor(motorChannel1)
-                
-                # make sure it's off to start
-                magnet1.run(Adafruit_MotorHAT.RELEASE)
-                
-                # add to list of magnets for this body part
-                magnets.append(magnet1)
-
-                
-            if row['motorAddr2'] is not None:
-                motorAddr2 = int(row['motorAddr2'])
-                
-                # add motor controller chip to dict if needed
-                if not motorAddr2 in motorControllers:
-                    motorControllers[motorAddr2] = Adafruit_MotorHAT(addr=motorAddr2,
-                                                                     freq=100)
-                    
-                # get channel on this motor controller
-                motorChannel2 = int(row['motorChannel2'])
-                magnet2 = motorControllers[motorAddr2].getMotor(motorChannel2)
-                
-                # make sure it's off to start
-                magnet2.run(Adafruit_MotorHAT.RELEASE)
-                
-                # add to list of magnets for this body part
-                magnets.append(magnet2)
-            
-            # create this body part
-            part = body_part.BodyPart(name, pin, magnets, tag, soundfile)
-            
-            # add to dict of body parts
-            bodyParts[pin] = part
-
+        for row in reader:
+            rows[int(row['pin'])] = row
+    
+    # get rid of parts that are gone or changed
+    for pin, part in list(bodyParts.items()):
+        if configRows.get(pin) != rows.get(pin):
+            removePart(part)
+            del bodyParts[pin]
+    
+    # reset the parts we're keeping, and build the rest
+    parts = dict()
+    for pin, row in rows.items():
+        if pin in bodyParts:
+            bodyParts[pin].reset()
+            parts[pin] = bodyParts[pin]
+        else:
+            parts[pin] = buildPart(row)
+    
+    # keep the config file order
+    bodyParts = parts
+    configRows.clear()
+    configRows.update(rows)
+    
+    # nothing's been found yet
+    partTable.configure(bodyParts.keys())
 
     print('Initialized')
     
     
+def nextEvent(timeout=None):
+    """Wait for the next event. Blocks until something happens,
+    or returns None if the timeout (in seconds) expires first.
+    """
+    try:
+        return events.get(timeout=timeout)
+    except queue.Empty:
+        return None
+    
+def clearEvents():
+    """Throw away any events left over from the last game
+    """
+    while True:
+        try:
+            events.get_nowait()
+        except queue.Empty:
+            return
+    
+def handleEvent(event, currentState):
+    """Return the next state for an event, staying put if the
+    event doesn't cause a transition
+    """
+    return transitions.get(event, currentState)
+    
+def waitForEvents(timeout, currentState):
+    """Handle events for a while. Returns the new state if an event
+    causes a transition, or None if the time runs out first.
+    """
+    deadline = time.monotonic() + timeout
+    
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        
+        event = nextEvent(timeout=remaining)
+        if event is not None and handleEvent(event, currentState) != currentState:
+            return handleEvent(event, currentState)
+    
 def main():
     global state
     global bodyParts
-    global restartTimer
-    global numPartsFound
     
     init()
     
     # try-finally block to handle clean up
     try:
         state = ZombieState.RESET
+        entered = time.perf_counter()
         
         # infinite loop
         while True:
+            previous = state
+            
             # state machine
             if state == ZombieState.RESET:
-                # wakeup the microcontrollers
-                wakeup()
+                # anything that happened before now is stale
+                clearEvents()
+                
+                # initialize sound device (does nothing if it's already running)
+                sound_engine.init()
     
                 # read the config file
                 configZombie()
                 
+                # wakeup the microcontrollers that need it
+                wakeup()
+                
                 # lock the lock
                 client.publish(topic="zombielock", payload="lock")
                 
+                # a new game starts now
+                config.gameLog.startGame()
+                
                 # start looking for body parts
                 print("Waiting for body parts")
-                numPartsFound = 0
                 state = ZombieState.LOCKED
                 
             elif state == ZombieState.LOCKED:
-                # idiot check on number of parts
-                if numPartsFound < 0:
-                    print('numPartsFound = ', numPartsFound)
-                    numPartsFound = 0
-                
                 # have we found everything?
-                if numPartsFound >= len(bodyParts):
+                if partTable.allFound():
                     print('Found them all')
                     state = ZombieState.FOUND_ALL
                 else:
-                    time.sleep(1.0)
+                    # sleep until a part is found or a command arrives
+                    state = handleEvent(nextEvent(), state)
                     
             elif state == ZombieState.FOUND_ALL:
                 print("Found all parts")
+                config.gameLog.log(game_log.ALL_FOUND)
                 
                 # cancel the timer if needed
-                if config.magnetTimer.is_alive():
-                    config.magnetTimer.cancel()
+                config.magnetTimer.cancel()
                     
-                # wait a little bit
-                time.sleep(5.0)
-                
-                # drop all the parts
-                state = ZombieState.DROP_PARTS
+                # wait a little bit, but still listen for commands (a part
+                # found just before the last one can still be queued, and
+                # it mustn't cut the wait short)
+                state = waitForEvents(5.0, state) or ZombieState.DROP_PARTS
                 
             elif state == ZombieState.DROP_PARTS:
                 print("Turning off magnets")
                 
-                # drop all  the parts
-                for part in  bodyParts.values():
-                   part.drop()
-                   time.sleep(1.0)
+                # drop all the parts on their own schedule (the magnet
+                # scheduler does the timing, so we can keep listening)
+                lastDrop = 0.0
+                for i, part in enumerate(bodyParts.values()):
+                    delay = part.dropDelay
+                    if delay is None:
+                        delay = i * defaultDropSpacing
+                    part.drop(delay)
+                    lastDrop = max(lastDrop, delay)
                    
-                # unlock everything next
-                state = ZombieState.UNLOCK
+                # unlock everything next, unless we're told otherwise first
+                wait = lastDrop if unlockDelay is None else unlockDelay
+                state = waitForEvents(wait, state) or ZombieState.UNLOCK
                 
             elif state == ZombieState.UNLOCK:
                 print("Unlocking")
+                config.gameLog.log(game_log.UNLOCK)
                 
                 # send msg to unlock
                 client.publish(topic="zombielock", payload="unlock")
        
-                # restart the magnet timer
-                config.magnetTimer = Timer(7200.0, magnetTimer_callback)
+                # the magnets are off, so stop the magnet timer
+                config.magnetTimer.cancel()
                 
                 # start the timer to reset the prop
-                restartTimer = Timer(1800.0, restartTimer_callback)
                 restartTimer.start()
                  
                 # wait until reset
                 state = ZombieState.PAUSE
                 
             elif state == ZombieState.PAUSE:
-                time.sleep(1)
+                # sleep until reset, unlock, or a timer fires
+                state = handleEvent(nextEvent(), state)
                 
             else:
                 # unknown state, so reset
                 state = ZombieState.RESET
                 
+            # how long we spent in the state we just left
+            if state != previous:
+                now = time.perf_counter()
+                stateTime.labels(previous.name).observe(now - entered)
+                entered = now
+                
     except KeyboardInterrupt:
         pass
     
@@ -369,8 +657,8 @@ def main():
         client.loop_stop()
         client.disconnect()
         config.magnetTimer.cancel()
-        if restartTimer is not None:
-            restartTimer.cancel()
+        restartTimer.cancel()
+        config.gameLog.close()
         
         
         
@@ -7,6 +7,12 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'zombieweb.sqlite'),
+        MQTT_BROKER='localhost',
+        MQTT_STATUS_TOPIC='zombie/status',
+        MQTT_INGEST=True,
+        DEVICE_TOKEN=None,
+        USER_CACHE_TTL=5.0,
+        GAME_LOG='/var/lib/zombie/games.log',
     )
     
     if test_config is None:
@@ -25,11 +31,28 @@ def create_app(test_config=None):
     from . import db
     db.init_app(app)
     
+    # first, so the request timing covers the other blueprints' hooks
+    from . import monitor
+    app.register_blueprint(monitor.bp)
+    
+    from . import assets
+    assets.init_app(app)
+    
     from . import auth
     app.register_blueprint(auth.bp)
+    app.session_interface = auth.SessionlessInterface()
     
     from . import status
     app.register_blueprint(status.bp)
     app.add_url_rule('/', endpoint='index')
     
+    from . import analytics
+    app.register_blueprint(analytics.bp)
+    
+    from . import api
+    app.register_blueprint(api.bp)
+    
+    # the MQTT ingestor is started by zombieweb.wsgi, so flask commands
+    # (init-db and so on) never write to the database behind our backs
+    
     return app
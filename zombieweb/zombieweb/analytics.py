@@ -0,0 +1,12 @@
+from flask import Blueprint, current_app, render_template
+
+from zombieweb.gamelog import analyze, history
+
+bp = Blueprint('analytics', __name__)
+
+@bp.route('/analytics')
+def index():
+    # straight from the prop's game log, nothing goes through the database
+    games = history.games(current_app.config['GAME_LOG'])
+    
+    return render_template('analytics/index.html', **analyze(games))
@@ -0,0 +1,67 @@
+import json
+
+from flask import Blueprint, Response, request
+
+from zombieweb.auth import sessionless
+from zombieweb.cache import VersionedCache, status_cache
+from zombieweb.feed import feed
+from zombieweb.status import load_status
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+# the whole status as JSON, rebuilt only when the version changes
+snapshot_cache = VersionedCache(feed)
+
+def load_snapshot():
+    version, status = status_cache.get(load_status)
+
+    snapshot = {
+        'version': feed.tag(version),
+        'full': True,
+        'parts': [dict(row) for row in status['parts']],
+        'locks': [dict(row) for row in status['locks']],
+        'candles': [dict(row) for row in status['candles']],
+        'timers': [dict(row) for row in status['timers']],
+    }
+
+    # tag it with the version the data is from, which can be newer than
+    # the one the snapshot cache saw
+    return version, json.dumps(snapshot)
+
+def json_response(body, version):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(feed.tag(version))
+
+    # always check back, but a matching ETag costs next to nothing
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/status')
+@sessionless
+def status():
+    # ?since=<version> gets just the changes after that version, if we
+    # still have them; otherwise (or with no since) it's the whole status.
+    # A change of type reset means start over with the whole status.
+    version = feed.version
+
+    # nothing changed since the client's copy -- no database, no JSON
+    if feed.tag(version) in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(feed.tag(version))
+        return response
+
+    since = feed.parse_tag(request.args.get('since'))
+    if since is not None:
+        changes = feed.changes_since(since)
+        if changes is not None:
+            if changes:
+                version = changes[-1][0]
+            body = json.dumps({
+                'version': feed.tag(version),
+                'full': False,
+                'changes': [change for v, change in changes],
+            })
+            return json_response(body, version)
+
+    version, body = snapshot_cache.get(load_snapshot)[1]
+    return json_response(body, version)
@@ -0,0 +1,229 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+from zombieweb.auth import sessionless
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+bp = Blueprint('assets', __name__)
+
+# stylesheets to build, from the static folder
+STYLESHEETS = ('w3.css',)
+
+# built files go in static/assets, named by their contents
+ASSET_DIR = 'assets'
+MANIFEST = 'manifest.json'
+
+# fingerprinted files never change, so browsers can keep them for a year
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# the built name of each asset, if they've been built
+_manifest = {}
+
+
+def asset_url(filename):
+    # url for a static file -- the built one if there is one
+    built = _manifest.get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', filename=built)
+
+
+@bp.route('/assets/<path:filename>')
+@sessionless
+def asset(filename):
+    # serve the precompressed copy if the browser takes it
+    directory = os.path.join(current_app.static_folder, ASSET_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    served = filename
+    encoding = None
+    for ext, name in (('.br', 'br'), ('.gz', 'gzip')):
+        if (request.accept_encodings[name] > 0 and
+                os.path.exists(os.path.join(directory, filename + ext))):
+            served = filename + ext
+            encoding = name
+            break
+
+    response = send_from_directory(directory, served, mimetype=mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def used_classes(template_folder):
+    # every class named in a class="..." attribute in the templates
+    classes = set()
+    for root, dirs, files in os.walk(template_folder):
+        for name in files:
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                for attr in re.findall(r'class="([^"]*)"', f.read()):
+                    classes.update(attr.split())
+    return classes
+
+
+def parse_css(text):
+    # split css into (prelude, body) blocks -- body is a list of blocks for
+    # @media, and the declarations as a string for everything else
+    blocks = []
+    i = 0
+    while i < len(text):
+        start = text.find('{', i)
+        if start < 0:
+            break
+
+        prelude = text[i:start].strip()
+        depth = 0
+        for end in range(start, len(text)):
+            if text[end] == '{':
+                depth += 1
+            elif text[end] == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+
+        body = text[start + 1:end]
+        if prelude.startswith('@media'):
+            blocks.append((prelude, parse_css(body)))
+        else:
+            blocks.append((prelude, body.strip()))
+        i = end + 1
+
+    return blocks
+
+
+def prune_css(blocks, classes):
+    # drop selectors that need a class we never use, and rules with no
+    # selectors left
+    kept = []
+    for prelude, body in blocks:
+        if isinstance(body, list):
+            body = prune_css(body, classes)
+            if body:
+                kept.append((prelude, body))
+        elif prelude.startswith('@'):
+            kept.append((prelude, body))
+        else:
+            selectors = [s for s in prelude.split(',')
+                         if set(re.findall(r'\.([\w-]+)', s)) <= classes]
+            if selectors:
+                kept.append((','.join(selectors), body))
+
+    return kept
+
+
+def prune_keyframes(blocks, css):
+    # drop animations that nothing uses any more
+    return [(prelude, body) for prelude, body in blocks
+            if not prelude.startswith('@keyframes') or
+            re.search(r'animation[\w-]*:[^;}]*\b%s\b' % re.escape(prelude.split()[-1]), css)]
+
+
+def render_css(blocks):
+    out = []
+    for prelude, body in blocks:
+        if isinstance(body, list):
+            body = render_css(body)
+        else:
+            body = minify_declarations(body)
+        out.append(minify_selector(prelude) + '{' + body + '}')
+    return ''.join(out)
+
+
+def minify_selector(text):
+    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r'\s*([,>{}])\s*', r'\1', text)
+
+
+def minify_declarations(text):
+    # @keyframes bodies are nested blocks, so keep their braces tidy too
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = re.sub(r'\s*([{};:,])\s*', r'\1', text)
+    return text.rstrip(';').replace(';}', '}')
+
+
+def build_css(text, classes):
+    text = re.sub(r'/\*.*?\*/', '', text.lstrip('﻿'), flags=re.S)
+    blocks = prune_css(parse_css(text), classes)
+    css = render_css(blocks)
+
+    # a second pass once we know which animations are still used
+    return render_css(prune_keyframes(blocks, css))
+
+
+def write_asset(directory, filename, data):
+    # fingerprinted file plus gzip (and brotli, if it's installed) copies
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    base, ext = os.path.splitext(filename)
+    built = '%s.%s%s' % (base, digest, ext)
+    path = os.path.join(directory, built)
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        # mtime=0 so the same css always gives the same file
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+    return built
+
+
+def build_assets():
+    static = current_app.static_folder
+    directory = os.path.join(static, ASSET_DIR)
+    os.makedirs(directory, exist_ok=True)
+
+    # start clean, so old fingerprints don't pile up
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+
+    classes = used_classes(os.path.join(current_app.root_path,
+                                        current_app.template_folder))
+    manifest = {}
+    for filename in STYLESHEETS:
+        with open(os.path.join(static, filename), encoding='utf-8') as f:
+            css = build_css(f.read(), classes)
+        manifest[filename] = write_asset(directory, filename, css.encode('utf-8'))
+
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return manifest
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Prune, minify, fingerprint and compress the stylesheets"""
+    for filename, built in sorted(build_assets().items()):
+        click.echo('%s -> %s/%s' % (filename, ASSET_DIR, built))
+    if brotli is None:
+        click.echo('(brotli not installed, so gzip only)')
+
+
+def init_app(app):
+    app.register_blueprint(bp)
+    app.add_template_global(asset_url)
+    app.cli.add_command(build_assets_command)
+
+    try:
+        with open(os.path.join(app.static_folder, ASSET_DIR, MANIFEST)) as f:
+            _manifest.update(json.load(f))
+    except (OSError, ValueError):
+        # not built, so templates get the plain static files
+        pass
@@ -1,13 +1,23 @@
 import functools
+import hmac
+import threading
+import time
 
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, abort, current_app, flash, g, redirect, render_template,
+    request, session, url_for
 )
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.exceptions import HTTPException
 from werkzeug.security import check_password_hash, generate_password_hash
 from zombieweb.db import get_db
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+# user rows for logged in operators, by id: (expires, row)
+_users = {}
+_users_lock = threading.Lock()
+
 @bp.route('/login', methods=('POST',))
 def login():
     if request.method == 'POST':
@@ -33,22 +43,81 @@ def login():
         
     return render_template('auth/login.html')
 
+class SessionlessInterface(SecureCookieSessionInterface):
+    # Flask opens the session before it matches the URL, so sessionless
+    # views (see below) would still pay for reading and verifying the
+    # cookie. This matches the URL first and gives those views a null
+    # session instead.
+    def open_session(self, app, request):
+        try:
+            endpoint, args = app.create_url_adapter(request).match()
+        except HTTPException:
+            endpoint = None
+        
+        if getattr(app.view_functions.get(endpoint), 'sessionless', False):
+            return self.make_null_session(app)
+        
+        return super().open_session(app, request)
+
 @bp.before_app_request
 def load_logged_in_user():
+    # devices and the API don't have a session (see SessionlessInterface),
+    # so there's no user to look up either
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'sessionless', False):
+        g.user = None
+        return
+    
     user_id = session.get('user_id')
     
     if user_id is None:
         g.user = None
     else:
-        g.user = get_db().execute(
-            'SELECT * FROM users WHERE id = ?', (user_id,)
-        ).fetchone()
+        g.user = cached_user(user_id)
+
+def cached_user(user_id):
+    # the user row, from the database at most every USER_CACHE_TTL seconds
+    now = time.monotonic()
+    with _users_lock:
+        cached = _users.get(user_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    
+    user = get_db().execute(
+        'SELECT * FROM users WHERE id = ?', (user_id,)
+    ).fetchone()
+    
+    with _users_lock:
+        _users[user_id] = (now + current_app.config['USER_CACHE_TTL'], user)
+    return user
         
 @bp.route('/logout')
 def logout():
     session.clear()
     return redirect(url_for('index'))
 
+def device_endpoint(view):
+    # for machine to machine requests from the prop and devices: no session
+    # or user lookup, just the DEVICE_TOKEN (if one is set) in an
+    # X-Device-Token header
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        token = current_app.config['DEVICE_TOKEN']
+        if token is not None:
+            sent = request.headers.get('X-Device-Token', '')
+            if not hmac.compare_digest(sent.encode(), token.encode()):
+                abort(403)
+        
+        return view(**kwargs)
+    
+    wrapped_view.sessionless = True
+    return wrapped_view
+
+def sessionless(view):
+    # for public reads that never need to know who's asking
+    view.sessionless = True
+    return view
+
 def login_required(view):
     @functools.wraps(view)
     def wrapped_view(**kwargs):
@@ -0,0 +1,86 @@
+import logging
+import os
+import threading
+
+from flask import current_app
+import paho.mqtt.client as mqtt
+
+
+class Broker(object):
+    """Long-lived connection to the MQTT broker, shared by every request
+    thread in this worker process.
+
+    The client runs its own network thread and reconnects by itself, so
+    publish() only waits on the broker while it's (re)connecting, and only
+    if asked to. Messages go out at QoS 1, and the returned MQTTMessageInfo
+    tells whether the broker has acked them. Messages are only sent while
+    connected, and never resent after a reconnect -- a late "unlock" or
+    "reset" is worse than none.
+    """
+
+    def __init__(self, hostname='localhost', port=1883):
+        self.hostname = hostname
+        self.port = port
+        self.pid = os.getpid()
+        self._connected = threading.Event()
+
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.max_queued_messages_set(100)
+
+        # connect in the background, so the first request doesn't wait
+        self.client.connect_async(hostname, port)
+        self.client.loop_start()
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def publish(self, topic, payload, qos=1, wait=0.0):
+        """Send a message, returning its MQTTMessageInfo, or None if
+        we're not connected (after waiting up to wait seconds for it)
+        """
+        if not self._connected.wait(wait):
+            return None
+        return self.client.publish(topic, payload=payload, qos=qos)
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        # paho resends anything the broker hadn't acked when we lost the
+        # connection, right after this returns -- forget them instead
+        with client._out_message_mutex:
+            client._out_messages.clear()
+            client._inflight_messages = 0
+
+        if rc == 0:
+            self._connected.set()
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+
+    def _on_publish(self, client, userdata, mid):
+        # the message info objects handed out by publish() are updated by
+        # paho, this just leaves a trail in the log
+        logger.debug('MQTT message %d delivered', mid)
+
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+
+    with _lock:
+        # a forked worker needs its own connection
+        if _broker is None or _broker.pid != os.getpid():
+            _broker = Broker(current_app.config['MQTT_BROKER'])
+
+        return _broker
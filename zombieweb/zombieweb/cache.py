@@ -0,0 +1,39 @@
+import threading
+
+from zombieweb.feed import feed
+
+
+class VersionedCache(object):
+    """Caches a value loaded from the database until the feed version
+    changes. Every status write publishes to the feed, so a cached value
+    is good for exactly as long as the version stays the same.
+    """
+
+    def __init__(self, feed):
+        self._feed = feed
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self, load):
+        # returns (version, value), calling load() only if out of date
+        entry = self._entry
+        if entry is not None and entry[0] == self._feed.version:
+            return entry
+
+        with self._lock:
+            # someone else may have just reloaded it
+            version = self._feed.version
+            entry = self._entry
+            if entry is not None and entry[0] == version:
+                return entry
+
+            # a write during load() bumps the version, so a stale value
+            # never outlives the next request
+            entry = (version, load())
+            self._entry = entry
+
+            return entry
+
+
+# the status shown on the main page
+status_cache = VersionedCache(feed)
@@ -1,31 +1,134 @@
+import functools
+import re
 import sqlite3
+import threading
+import time
 
 import click
 from flask import current_app, g
 from flask.cli import with_appcontext
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from zombieweb import metrics
+
+# open connections for each thread, indexed by database path
+_local = threading.local()
+
+# version of schema.sql, kept in the database's user_version. When the
+# schema changes, bump this and add the SQL that upgrades the previous
+# version to MIGRATIONS, e.g.
+#   2: 'ALTER TABLE bodyparts ADD COLUMN found_at REAL;',
+SCHEMA_VERSION = 1
+MIGRATIONS = {
+}
+
+# tables that only hold the state of the current game
+GAME_TABLES = ('bodyparts', 'lockstatus', 'candles', 'timers')
+
+# databases we've already checked the version of
+_migrated = set()
+
+query_time = metrics.histogram(
+    'zombieweb_db_seconds', 'Time spent in SQLite, by statement', ['query'])
+
+@functools.lru_cache(maxsize=256)
+def query_name(sql):
+    # a short label for a statement, like "UPDATE bodyparts"
+    words = re.findall(r'\w+', sql)
+    for keyword, table in zip(words, words[1:]):
+        if keyword.upper() in ('FROM', 'INTO', 'UPDATE', 'TABLE'):
+            return '%s %s' % (words[0].upper(), table)
+    return words[0].upper() if words else ''
+
+class TimedConnection(sqlite3.Connection):
+    # a connection that times its statements and commits for /metrics
+    # (for a SELECT, that's the time to the first row)
+    def _observe(self, name, start):
+        query_time.labels(name).observe(time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(query_name(sql), start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(query_name(sql), start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._observe('SCRIPT', start)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self._observe('COMMIT', start)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # "with db:" commits (or rolls back) without calling commit()
+        start = time.perf_counter()
+        try:
+            return super().__exit__(exc_type, exc_value, traceback)
+        finally:
+            self._observe('COMMIT' if exc_type is None else 'ROLLBACK', start)
+
+def connect(path):
+    db = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        cached_statements=64,
+        factory=TimedConnection
+    )
+    db.row_factory = sqlite3.Row
+    
+    # WAL lets the status page read while the prop is writing
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute('PRAGMA busy_timeout = 5000')
+    db.execute('PRAGMA temp_store = MEMORY')
+    
+    return db
+
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        # reuse this thread's connection, so sqlite keeps its prepared
+        # statements around between requests
+        connections = getattr(_local, 'connections', None)
+        if connections is None:
+            connections = _local.connections = {}
+        
+        path = current_app.config['DATABASE']
+        if path not in connections:
+            connections[path] = connect(path)
+        
+        g.db = connections[path]
         
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     
-    if db is not None:
-        db.close()
+    # the connection stays open for the next request, but don't leave
+    # a half finished transaction holding locks
+    if db is not None and db.in_transaction:
+        db.rollback()
         
 def init_db():
     db = get_db()
     
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
+    db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
 
     username = 'zombie'
     password = 'Zombie attack!'
@@ -35,6 +138,39 @@ def init_db():
         'REPLACE INTO users (username, password) VALUES (?, ?)',
         (username, generate_password_hash(password))
     )
+    db.commit()
+    
+    _migrated.add(current_app.config['DATABASE'])
+
+def migrate_db():
+    # bring the schema up to date -- step by step from a known version,
+    # or a full rebuild for a new database (or one we can't upgrade)
+    path = current_app.config['DATABASE']
+    if path in _migrated:
+        return
+    
+    db = get_db()
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    
+    if version == 0 or version > SCHEMA_VERSION:
+        init_db()
+        return
+    
+    for step in range(version + 1, SCHEMA_VERSION + 1):
+        db.executescript(MIGRATIONS[step])
+        db.execute('PRAGMA user_version = %d' % step)
+        db.commit()
+    
+    _migrated.add(path)
+
+def reset_game():
+    # clear the last game, keeping the schema and the users
+    migrate_db()
+    
+    db = get_db()
+    with db:
+        for table in GAME_TABLES:
+            db.execute('DELETE FROM ' + table)
        
 @click.command('init-db')
 @with_appcontext
@@ -42,8 +178,16 @@ def init_db_command():
     """Clear the existing data and create new tables"""
     init_db()
     click.echo('Initialized the database')
+
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command():
+    """Upgrade the tables to the current schema, keeping the data"""
+    migrate_db()
+    click.echo('Database is at schema version %d' % SCHEMA_VERSION)
     
 def init_app(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
     
\ No newline at end of file
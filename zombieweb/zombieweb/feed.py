@@ -0,0 +1,82 @@
+import collections
+import json
+import os
+import threading
+
+
+class StatusFeed(object):
+    """Versioned list of recent status changes.
+
+    Every write to the status tables publishes a change here, which bumps
+    the version. Streaming clients wait on the feed and get just the
+    changes newer than the last version they saw. Only the most recent
+    changes are kept -- a client that falls further behind than that has
+    to reload the whole page.
+
+    Versions start over when the server restarts, so the epoch tells
+    this run's versions apart from the last one's.
+    """
+
+    def __init__(self, backlog=256):
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self._changes = collections.deque(maxlen=backlog)
+        self._cond = threading.Condition()
+
+    def tag(self, version):
+        # "<epoch>.<version>" -- versions are only unique within one run
+        return '%s.%d' % (self.epoch, version)
+
+    def parse_tag(self, tag):
+        # the version from a tag, or None if it's from some other run
+        epoch, _, version = (tag or '').partition('.')
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def publish(self, change):
+        with self._cond:
+            self.version += 1
+            self._changes.append((self.version, change))
+            self._cond.notify_all()
+
+            return self.version
+
+    def changes_since(self, since):
+        with self._cond:
+            return self._since(since)
+
+    def wait(self, since, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != since, timeout)
+            return self._since(since)
+
+    def _since(self, since):
+        # list of (version, change) newer than since, or None if we
+        # can't say what changed (too far behind, or the server restarted)
+        if since == self.version:
+            return []
+
+        if since > self.version:
+            return None
+
+        if not self._changes or self._changes[0][0] > since + 1:
+            return None
+
+        return [c for c in self._changes if c[0] > since]
+
+
+def sse_event(data, event=None, id=None):
+    # format one server-sent event
+    lines = []
+    if event is not None:
+        lines.append('event: ' + event)
+    if id is not None:
+        lines.append('id: ' + str(id))
+    lines.append('data: ' + json.dumps(data))
+
+    return '\n'.join(lines) + '\n\n'
+
+
+# the one feed for this process
+feed = StatusFeed()
@@ -0,0 +1,124 @@
+import glob
+import os
+import struct
+import threading
+import time
+
+# same format as game_log.py on the prop: time, event, GPIO pin, part name
+RECORD = struct.Struct('<dBB16s6x')
+
+GAME_START = 1
+PART_FOUND = 2
+ALL_FOUND = 3
+UNLOCK = 4
+
+class Game(object):
+    # one game from the log -- find times are seconds from the start
+    def __init__(self, start):
+        self.start = start
+        self.finds = {}
+        self.solved = None
+        self.unlocked = None
+
+def read_games(filename):
+    # split a log file into games (files only rotate between games)
+    games = []
+    game = None
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    for when, event, pin, name in RECORD.iter_unpack(data):
+        if when == 0.0:
+            # the rest of the file is empty
+            break
+
+        if event == GAME_START:
+            game = Game(when)
+            games.append(game)
+        elif game is None:
+            continue
+        elif event == PART_FOUND:
+            name = name.rstrip(b'\0').decode('utf-8', 'replace')
+            game.finds.setdefault(name, when - game.start)
+        elif event == ALL_FOUND and game.solved is None:
+            game.solved = when - game.start
+        elif event == UNLOCK and game.unlocked is None:
+            game.unlocked = when - game.start
+
+    return games
+
+class GameHistory(object):
+    # games from all the log files. Rotated files never change, so they're
+    # only read once; the current one is written through a memory map (which
+    # doesn't reliably update its mtime), so it's read every time.
+    def __init__(self):
+        self._rotated = {}
+        self._lock = threading.Lock()
+
+    def games(self, filename):
+        paths = [p for p in glob.glob(glob.escape(filename) + '.*')
+                 if p.rsplit('.', 1)[1].isdigit()]
+
+        # oldest first
+        paths.sort(key=lambda p: -int(p.rsplit('.', 1)[1]))
+
+        games = []
+        with self._lock:
+            rotated = {}
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                # rotating renames the files, so go by inode, not name
+                key = (stat.st_ino, stat.st_size)
+                rotated[key] = self._rotated.get(key) or read_games(path)
+                games.extend(rotated[key])
+
+            self._rotated = rotated
+
+        try:
+            games.extend(read_games(filename))
+        except OSError:
+            pass
+
+        return games
+
+history = GameHistory()
+
+def percentile(values, p):
+    # nearest-rank percentile of a sorted list
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values))) - 1))
+    return values[index]
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'min': values[0] if values else None,
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+    }
+
+def analyze(games):
+    # solve durations and per-part find times across the games
+    finds = {}
+    for game in games:
+        for name, t in game.finds.items():
+            finds.setdefault(name, []).append(t)
+
+    solved = [game.solved for game in games if game.solved is not None]
+
+    return {
+        'games': len(games),
+        'solved': summarize(solved),
+        'parts': [(name, summarize(times)) for name, times in sorted(finds.items())],
+        'recent': [{'start': time.strftime('%Y-%m-%d %H:%M', time.localtime(game.start)),
+                    'found': len(game.finds), 'solved': game.solved}
+                   for game in reversed(games[-10:])],
+    }
@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from zombieweb.db import connect
+from zombieweb.feed import feed
+
+
+# (update, insert) for each kind of status -- the insert only runs if
+# there's no row to update yet
+ingest_sql = {
+    'bodypart' : ('UPDATE bodyparts SET status = :status WHERE name = :name',
+                  'INSERT INTO bodyparts (name, status) VALUES (:name, :status)'),
+    'lock' : ('UPDATE lockstatus SET status = :status WHERE name = :name',
+              'INSERT INTO lockstatus (name, status) VALUES (:name, :status)'),
+    'candle' : ('UPDATE candles SET color = coalesce(:color, color),'
+                ' status = :status WHERE name = :name',
+                'INSERT INTO candles (name, color, status)'
+                ' VALUES (:name, :color, :status)'),
+}
+
+
+class Ingestor(object):
+    """Writes status published over MQTT into the database, so devices
+    can fire and forget instead of waiting on HTTP.
+
+    Devices publish to <topic>/<type>/<name>, where type is bodypart,
+    lock or candle, with a payload that's either just the status, like
+    "1", or JSON like {"status": 1, "color": "red"}. Publishing with the
+    retain flag means a restarted web server picks up the latest status.
+
+    Messages are coalesced by type and name, and a single writer thread
+    applies each batch in one transaction, then tells the live feed.
+    """
+
+    def __init__(self, database, hostname='localhost', port=1883,
+                 topic='zombie/status', batchDelay=0.05):
+        self.database = database
+        self.hostname = hostname
+        self.port = port
+        self.topic = topic
+        self.batchDelay = batchDelay
+        self.pid = os.getpid()
+
+        # latest update for each (type, name), waiting to be written
+        self._pending = {}
+        self._cond = threading.Condition()
+
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+        self._thread = threading.Thread(target=self._run, name='Ingestor',
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self.client.connect_async(self.hostname, self.port)
+        self.client.loop_start()
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        # (re)subscribe on every connect
+        if rc == 0:
+            client.subscribe(self.topic + '/#', qos=1)
+
+    def _on_message(self, client, userdata, msg):
+        update = self.parse(msg.topic, msg.payload)
+        if update is None:
+            logger.warning('Ignoring MQTT status %r on %s', msg.payload, msg.topic)
+            return
+
+        key = (update['type'], update['name'])
+        with self._cond:
+            # a newer status without a color keeps the older color
+            old = self._pending.get(key)
+            if old is not None and update['color'] is None:
+                update['color'] = old['color']
+
+            self._pending[key] = update
+            self._cond.notify()
+
+    def parse(self, topic, payload):
+        # <topic>/<type>/<name> and a status or JSON payload -> update dict
+        parts = topic[len(self.topic) + 1:].split('/', 1)
+        if len(parts) != 2 or parts[0] not in ingest_sql or not parts[1]:
+            return None
+
+        try:
+            value = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            return None
+
+        if not isinstance(value, dict):
+            value = {'status': value}
+        if 'status' not in value:
+            return None
+
+        # sqlite can only store plain values
+        scalar = (str, int, float, type(None))
+        if not isinstance(value['status'], scalar) or \
+                not isinstance(value.get('color'), scalar):
+            return None
+
+        return {'type': parts[0], 'name': parts[1], 'status': value['status'],
+                'color': value.get('color')}
+
+    def _run(self):
+        db = connect(self.database)
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+
+            # give the rest of a burst a moment to arrive
+            time.sleep(self.batchDelay)
+
+            with self._cond:
+                batch = list(self._pending.values())
+                self._pending.clear()
+
+            written = []
+            try:
+                with db:
+                    for update in batch:
+                        update_sql, insert_sql = ingest_sql[update['type']]
+                        try:
+                            if db.execute(update_sql, update).rowcount == 0:
+                                db.execute(insert_sql, update)
+                            written.append(update)
+                        except sqlite3.Error as e:
+                            # e.g. a new candle with no color -- skip just
+                            # this one, the rest of the batch still goes in
+                            logger.warning('Bad MQTT status %r: %s', update, e)
+            except sqlite3.Error:
+                logger.exception('Writing MQTT status failed')
+                continue
+
+            for update in written:
+                change = {'type': update['type'], 'name': update['name'],
+                          'status': update['status']}
+                if update['type'] == 'candle' and update['color'] is not None:
+                    change['color'] = update['color']
+                feed.publish(change)
+
+
+logger = logging.getLogger(__name__)
+
+_ingestor = None
+_lock = threading.Lock()
+
+def start_ingestor(app):
+    # start this process's ingestor, unless MQTT_INGEST is turned off
+    global _ingestor
+
+    if not app.config['MQTT_INGEST']:
+        return None
+
+    with _lock:
+        # a forked worker needs its own
+        if _ingestor is None or _ingestor.pid != os.getpid():
+            _ingestor = Ingestor(app.config['DATABASE'], app.config['MQTT_BROKER'],
+                                 topic=app.config['MQTT_STATUS_TOPIC'])
+            _ingestor.start()
+
+        return _ingestor
@@ -0,0 +1,33 @@
+import time
+
+from flask import Blueprint, Response, g, request
+
+from zombieweb import metrics
+from zombieweb.auth import sessionless
+
+bp = Blueprint('monitor', __name__)
+
+request_time = metrics.histogram(
+    'zombieweb_request_seconds', 'Time to handle a request, by route',
+    ['route', 'method'])
+
+@bp.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@bp.teardown_app_request
+def stop_timer(e=None):
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+
+    # the route, not the path, so /assets/<path:filename> is one series
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_time.labels(rule, request.method).observe(time.perf_counter() - start)
+
+@bp.route('/metrics')
+@sessionless
+def show():
+    # for prometheus -- everything this process has counted since it started
+    return Response(metrics.registry.render(),
+                    content_type=metrics.CONTENT_TYPE)
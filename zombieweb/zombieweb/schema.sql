@@ -2,6 +2,7 @@ DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS bodyparts;
 DROP TABLE IF EXISTS lockstatus;
 DROP TABLE IF EXISTS candles;
+DROP TABLE IF EXISTS timers;
 
 CREATE TABLE users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,4 +27,11 @@ CREATE TABLE candles (
     name TEXT UNIQUE NOT NULL,
     color TEXT UNIQUE NOT NULL,
     status INTEGER
-);
\ No newline at end of file
+);
+
+CREATE TABLE timers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    deadline REAL,
+    remaining REAL
+);
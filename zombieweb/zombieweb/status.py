@@ -1,16 +1,29 @@
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, Response, flash, g, redirect, render_template, request, url_for
 )
 from werkzeug.exceptions import abort
+import sqlite3
+import time
 
-from zombieweb.auth import login_required
-from zombieweb.db import get_db, init_db
-import paho.mqtt.publish as publish
+from zombieweb.auth import device_endpoint, login_required
+from zombieweb.broker import get_broker
+from zombieweb.cache import status_cache
+from zombieweb.db import get_db, reset_game
+from zombieweb.feed import feed, sse_event
+import paho.mqtt.client as mqtt
 
 bp = Blueprint('status', __name__)
 
 @bp.route('/')
 def index():
+    # the cache only hits the database after a status change
+    version, status = status_cache.get(load_status)
+    
+    # the page counts the timers down against our clock, not the browser's
+    return render_template('status/index.html', version=feed.tag(version),
+                           now=time.time(), **status)
+
+def load_status():
     db = get_db()
     parts = db.execute(
         'SELECT id, name, status'
@@ -20,40 +33,114 @@ def index():
     boxstatus = db.execute(
         'SELECT id, name, status'
         ' FROM lockstatus'
-        ' WHERE name = "Box"'
+        ' WHERE name = ?',
+        ('Box',)
     ).fetchone()
     casketstatus = db.execute(
         'SELECT id, name, status'
         ' FROM lockstatus'
-        ' WHERE name = "Casket"'
+        ' WHERE name = ?',
+        ('Casket',)
     ).fetchone()
     candles = db.execute(
         'SELECT id, name, color, status'
         ' FROM candles'
         ' ORDER BY name'
     ).fetchall()
+    locks = db.execute(
+        'SELECT id, name, status'
+        ' FROM lockstatus'
+        ' ORDER BY name'
+    ).fetchall()
+    timers = db.execute(
+        'SELECT id, name, deadline, remaining'
+        ' FROM timers'
+        ' ORDER BY name'
+    ).fetchall()
+    
+    return dict(parts=parts, boxstatus=boxstatus, casketstatus=casketstatus,
+                candles=candles, locks=locks, timers=timers)
+
+@bp.route('/stream')
+def stream():
+    # server-sent events with each status change after the given version.
+    # Event ids and ?since= are feed tags, so a page from before a server
+    # restart is told to reload instead of getting some other run's changes
+    tag = request.headers.get('Last-Event-ID') or request.args.get('since')
+    since = feed.version if tag is None else feed.parse_tag(tag)
+    
+    def generate(since):
+        if since is None:
+            yield sse_event({}, event='reload')
+            return
         
+        while True:
+            changes = feed.wait(since, timeout=15.0)
+            
+            if changes is None:
+                # we fell behind, so the page has to start over
+                yield sse_event({}, event='reload')
+                return
+            
+            if not changes:
+                # keep the connection alive
+                yield ': ping\n\n'
+            
+            for version, change in changes:
+                yield sse_event(change, id=feed.tag(version))
+                since = version
     
-    return render_template('status/index.html', parts=parts, boxstatus=boxstatus,
-                           casketstatus=casketstatus, candles=candles)
+    return Response(generate(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+# how long a command waits for the broker's connection, and then for it
+# to confirm the command, in seconds
+confirm_timeout = 1.0
+
+def send_command(topic, payload):
+    # send the msg on the shared MQTT connection (commands are never sent
+    # later, so the operator knows to try again)
+    info = get_broker().publish(topic, payload, wait=confirm_timeout)
+    
+    if info is None or info.rc != mqtt.MQTT_ERR_SUCCESS:
+        flash('Not connected to the MQTT broker, "' + payload
+              + '" was not sent')
+        return
+    
+    # the local broker acks in a few milliseconds, so this is only slow
+    # when something's wrong
+    info.wait_for_publish(timeout=confirm_timeout)
+    if not info.is_published():
+        flash('The MQTT broker did not confirm "' + payload
+              + '", it may not have been sent')
 
 @bp.route('/unlock', methods=('POST',))
 def unlock():
     # send a msg to the zombie
-    publish.single(topic="zombie", payload="unlock", hostname="localhost")
+    send_command("zombie", "unlock")
     return redirect(url_for('index'))
 
 @bp.route('/reset', methods=('POST',))
 def reset():
     # send a msg to the zombie
-    publish.single(topic="zombie", payload="reset", hostname="localhost")
+    send_command("zombie", "reset")
     return redirect(url_for('index'))
 
     
+def form_status():
+    # the form's status as an int, like the JSON routes and the database
+    # give it, so the feed's changes match the full status
+    status = request.form.get('status', type=int)
+    if status is None:
+        abort(400)
+    return status
+
 @bp.route('/insert', methods=('POST',))
+@device_endpoint
 def insert():
     name = request.form['name']
-    status = request.form['status']
+    status = form_status()
     
     db = get_db()
     db.execute(
@@ -62,12 +149,15 @@ def insert():
         (name, status)
     )
     db.commit()
+    
+    feed.publish({'type': 'bodypart', 'name': name, 'status': status})
     return 'OK'
 
 @bp.route('/update', methods=('POST',))
+@device_endpoint
 def update():
     name = request.form['name']
-    status = request.form['status']
+    status = form_status()
         
     db = get_db()
     db.execute(
@@ -76,12 +166,69 @@ def update():
         (status, name)
     )
     db.commit()
+    
+    feed.publish({'type': 'bodypart', 'name': name, 'status': status})
+    return 'OK'
+
+# SQL for each kind of bulk update, indexed by (type, insert)
+bulk_sql = {
+    ('bodypart', True) : ('REPLACE INTO bodyparts (name, status)'
+                          ' VALUES (:name, :status)'),
+    ('bodypart', False) : ('UPDATE bodyparts SET status = :status'
+                           ' WHERE name = :name'),
+    ('lock', True) : ('REPLACE INTO lockstatus (name, status)'
+                      ' VALUES (:name, :status)'),
+    ('lock', False) : ('UPDATE lockstatus SET status = :status'
+                       ' WHERE name = :name'),
+    ('candle', True) : ('REPLACE INTO candles (name, color, status)'
+                        ' VALUES (:name, :color, :status)'),
+    ('candle', False) : ('UPDATE candles SET color = :color, status = :status'
+                         ' WHERE name = :name'),
+    # timers always carry their whole state, so they're always replaced
+    ('timer', True) : ('REPLACE INTO timers (name, deadline, remaining)'
+                       ' VALUES (:name, :deadline, :remaining)'),
+    ('timer', False) : ('REPLACE INTO timers (name, deadline, remaining)'
+                        ' VALUES (:name, :deadline, :remaining)'),
+}
+
+@bp.route('/bulk', methods=('POST',))
+@device_endpoint
+def bulk():
+    # JSON array of updates, each like
+    #   {"type": "bodypart", "name": "Head", "status": 1, "insert": false}
+    # where type is bodypart, lock or candle (candles also need a color),
+    # or timers like
+    #   {"type": "timer", "name": "Restart", "deadline": 1700000000.0,
+    #    "remaining": 1800.0}
+    # with deadline from time.time() (null while stopped or paused)
+    updates = request.get_json(silent=True)
+    if not isinstance(updates, list):
+        abort(400)
+    
+    db = get_db()
+    try:
+        # apply them all in one transaction
+        with db:
+            for update in updates:
+                sql = bulk_sql[(update['type'], bool(update.get('insert')))]
+                db.execute(sql, update)
+    except (KeyError, TypeError, sqlite3.IntegrityError,
+            sqlite3.InterfaceError, sqlite3.ProgrammingError):
+        # e.g. a new candle with no color, or a status that's a list
+        abort(400)
+    
+    for update in updates:
+        change = dict((key, value) for key, value in update.items()
+                      if key != 'insert')
+        feed.publish(change)
+    
     return 'OK'
 
 @bp.route('/initlock', methods=('POST',))
+@device_endpoint
 def initlock():
     name = request.form['lockname']
-    status = request.form['status']
+    status = form_status()
     
     db = get_db()
     db.execute(
@@ -90,12 +237,15 @@ def initlock():
         (name, status)
     )
     db.commit()
+    
+    feed.publish({'type': 'lock', 'name': name, 'status': status})
     return 'OK'
     
 @bp.route('/updatelock', methods=('POST',))
+@device_endpoint
 def updatelock():
     name = request.form['lockname']
-    status = request.form['status']
+    status = form_status()
     
     db = get_db()
     db.execute(
@@ -104,12 +254,15 @@ def updatelock():
         (status, name)
     )
     db.commit()
+    
+    feed.publish({'type': 'lock', 'name': name, 'status': status})
     return 'OK'
 
 @bp.route('/insertcandle', methods=('POST',))
+@device_endpoint
 def insertcandle():
     name = request.form['name']
-    status = request.form['status']
+    status = form_status()
     color = request.form['color']
     
     db = get_db()
@@ -119,12 +272,16 @@ def insertcandle():
         (name, color, status)
     )
     db.commit()
+    
+    feed.publish({'type': 'candle', 'name': name, 'color': color,
+                  'status': status})
     return 'OK'
 
 @bp.route('/updatecandle', methods=('POST',))
+@device_endpoint
 def updatecandle():
     name = request.form['name']
-    status = request.form['status']
+    status = form_status()
     color = request.form['color']
         
     db = get_db()
@@ -134,29 +291,36 @@ def updatecandle():
         (color, status, name)
     )
     db.commit()
+    
+    feed.publish({'type': 'candle', 'name': name, 'color': color,
+                  'status': status})
     return 'OK'
 
 @bp.route('/closecasket', methods=('POST',))
 def closecasket():
     # send a msg to the casket
-    publish.single(topic="/casket/command", payload="close", hostname="localhost")
+    send_command("/casket/command", "close")
     return redirect(url_for('index'))
 
 @bp.route('/opencasket', methods=('POST',))
 def opencasket():
     # send a msg to the casket
-    publish.single(topic="/casket/command", payload="open", hostname="localhost")
+    send_command("/casket/command", "open")
     return redirect(url_for('index'))
 
 @bp.route('/closecasketdelay', methods=('POST',))
 def opencasketdelay():
     # send a msg to the casket
-    publish.single(topic="/casket/command", payload="closedelay", hostname="localhost")
+    send_command("/casket/command", "closedelay")
     return redirect(url_for('index'))
 
 
 @bp.route('/init', methods=('GET', 'POST'))
+@device_endpoint
 def init():
-    init_db()
+    # just the game state -- the schema and users stay put
+    reset_game()
     
+    # everything's gone, so live pages have to start over
+    feed.publish({'type': 'reset'})
     return 'OK'
\ No newline at end of file